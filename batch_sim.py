@@ -0,0 +1,148 @@
+import numpy as np
+
+from bitboard import PIECE_MASKS, PLACEMENT_TABLES, HEIGHT, FULL_ROW
+from genetic_ai import ROW_BITS, get_ratings
+from pytris_core import PieceGenerator
+
+MAX_CANDIDATES = max(sum(len(p.xs) for p in placements) for placements in PLACEMENT_TABLES.values())
+SCORE_MULTIPLIER = np.array([0, 50, 150, 350, 1000])
+CELLS = ROW_BITS.astype(bool)   # ROW_BITS as booleans, keeps stacked boards small
+
+
+def build_candidate_tables():
+    """
+    Lays the placements of every piece out as fixed size arrays indexed by
+    [piece_id, candidate], in the order genetic_ai.get_placements yields them.
+    Pieces with fewer placements are padded with invalid candidates
+    """
+    shape = (len(PLACEMENT_TABLES) + 1, MAX_CANDIDATES)
+    tables = {
+        'valid': np.zeros(shape, dtype=bool),
+        'rotation': np.zeros(shape, dtype=int),
+        'x': np.zeros(shape, dtype=int),
+        'cols': np.zeros(shape + (4,), dtype=int),
+        'bottom': np.full(shape + (4,), -HEIGHT, dtype=int),  # padded columns never win the min
+        'row_offset': np.zeros(shape + (4,), dtype=int),
+        'row_mask': np.zeros(shape + (4,), dtype=np.int64),
+    }
+    for mino, placements in PLACEMENT_TABLES.items():
+        c = 0
+        for placement in placements:
+            for x in placement.xs:
+                tables['valid'][mino, c] = True
+                tables['rotation'][mino, c] = placement.rotation
+                tables['x'][mino, c] = x
+                for k, (j, bottom) in enumerate(placement.skyline):
+                    tables['cols'][mino, c, k] = x + j
+                    tables['bottom'][mino, c, k] = bottom
+                for k, (i, mask) in enumerate(PIECE_MASKS[mino][placement.rotation][x]):
+                    tables['row_offset'][mino, c, k] = i
+                    tables['row_mask'][mino, c, k] = mask
+                c += 1
+    return tables
+
+
+def build_spawn_masks():
+    """
+    Row masks of every piece at the spawn position (rotation 0, x 3, y 0)
+    """
+    masks = np.zeros((len(PLACEMENT_TABLES) + 1, 4), dtype=np.int64)
+    for mino in PLACEMENT_TABLES:
+        for i, mask in PIECE_MASKS[mino][0][3]:
+            masks[mino, i] = mask
+    return masks
+
+
+CANDIDATES = build_candidate_tables()
+SPAWN_MASKS = build_spawn_masks()
+
+
+def piece_sequence(seed, length):
+    """
+    First length pieces a PytrisCore seeded with seed would play
+    """
+    return PieceGenerator(seed).take(length)
+
+
+class BatchSimulator:
+    """
+    Plays many headless games in lockstep. Boards are held as a (games, HEIGHT)
+    array of packed rows and every step places one piece in every running game,
+    rating all candidates of all games with the vectorized genetic_ai features.
+    Games follow the PytrisCore.run_headless rules, except that a piece which
+    can only enter the board through the spawn rows counts as a top out
+    """
+    def __init__(self, genotypes, seeds, max_pieces=500):
+        self.genotypes = np.asarray(genotypes, dtype=float)
+        n_games = len(self.genotypes)
+        self.max_pieces = max_pieces
+        self.pieces = np.array([piece_sequence(seed, max_pieces + 2) for seed in seeds])
+        self.boards = np.zeros((n_games, HEIGHT), dtype=np.int64)
+        self.scores = np.zeros(n_games, dtype=int)
+        self.lines = np.zeros(n_games, dtype=int)
+        self.pieces_dropped = np.zeros(n_games, dtype=int)
+        self.alive = np.ones(n_games, dtype=bool)
+        self.level = 1
+
+    def step(self):
+        """
+        Places the current piece of every running game and clears lines
+        """
+        games = np.flatnonzero(self.alive)
+        if not len(games):
+            return
+        boards = self.boards[games]
+        mino = self.pieces[games, self.pieces_dropped[games]]
+
+        # Landing rows from column heights
+        cells = CELLS[boards]
+        peaks = np.where(cells.any(axis=1), HEIGHT - np.argmax(cells, axis=1), 0)
+        cols = CANDIDATES['cols'][mino]
+        column_peaks = np.take_along_axis(peaks[:, None, :], cols.reshape(len(games), 1, -1), axis=2)
+        y = np.min(HEIGHT - 1 - column_peaks.reshape(cols.shape) - CANDIDATES['bottom'][mino], axis=2)
+        valid = CANDIDATES['valid'][mino] & (y >= 0)
+        y = np.where(valid, y, 0)
+
+        # Write every candidate into a copy of its board
+        placed = np.repeat(boards[:, None, :], MAX_CANDIDATES, axis=1)
+        g, c = np.indices(y.shape)
+        for k in range(4):
+            rows = y + CANDIDATES['row_offset'][mino][..., k]
+            placed[g, c, rows] |= CANDIDATES['row_mask'][mino][..., k]
+
+        full = placed == FULL_ROW
+        ratings = get_ratings(CELLS[placed], np.count_nonzero(full, axis=-1))
+        scores = np.einsum('gcf,gf->gc', ratings, self.genotypes[games])
+        scores[~valid] = -np.inf
+        best = np.argmax(scores, axis=1)
+        placeable = valid[np.arange(len(games)), best]
+
+        # Clear lines, full rows go to the top and are replaced by the hidden top row like in Pytris
+        boards = placed[np.arange(len(games)), best]
+        full = full[np.arange(len(games)), best]
+        erase_count = np.count_nonzero(full, axis=1)
+        order = np.argsort(~full, axis=1, kind='stable')
+        cleared = np.take_along_axis(boards, order, axis=1)
+        cleared = np.where(np.arange(HEIGHT) < erase_count[:, None], boards[:, :1], cleared)
+
+        games = games[placeable]
+        cleared = cleared[placeable]
+        erase_count = erase_count[placeable]
+        self.boards[games] = cleared
+        self.scores[games] += SCORE_MULTIPLIER[erase_count] * self.level
+        self.lines[games] += erase_count
+        self.pieces_dropped[games] += 1
+
+        # Game over when the piece after next can't spawn or the piece limit is reached
+        self.alive[self.alive] = placeable
+        spawn = SPAWN_MASKS[self.pieces[games, self.pieces_dropped[games] + 1]]
+        blocked = np.any(cleared[:, :4] & spawn, axis=1)
+        self.alive[games] = ~blocked & (self.pieces_dropped[games] < self.max_pieces)
+
+    def run(self):
+        """
+        Steps until every game is over, returning the scores
+        """
+        while self.alive.any():
+            self.step()
+        return self.scores
@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+import numpy as np
+
+import genetic_ai
+import train
+from genetic_ai import Genetic_AI, TOP_GENE_WEIGHTS, ROW_BITS
+from board_features import BoardFeatures
+from batch_sim import BatchSimulator
+from pytris_core import PytrisCore
+
+BASELINE_FILE = Path(Path(__file__).parent.absolute(), "benchmark_baseline.json")
+SEEDS = [0, 1, 2]           # Piece seeds of the benchmark games
+TOLERANCE = 0.10            # Relative change reported as a regression
+
+
+def best_time(func, repeat, number=1):
+    """
+    Times repeat rounds of number calls of func, returning the fastest
+    time per call and the last result
+    """
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            result = func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best, result
+
+
+def play_benchmark_games():
+    pieces = 0
+    for seed in SEEDS:
+        game = PytrisCore(ai=Genetic_AI(genotype=np.array(TOP_GENE_WEIGHTS)), seed=seed)
+        game.run_headless()
+        pieces += game.pieces
+    return pieces
+
+
+def collect_positions():
+    """
+    Returns (features, mino) of every position of the first benchmark game
+    """
+    ai = Genetic_AI(genotype=np.array(TOP_GENE_WEIGHTS))
+    bag = PytrisCore(seed=SEEDS[0])
+    features = BoardFeatures()
+    positions = []
+    for _ in range(500):
+        mino = bag.get_mino_from_bag()
+        move = ai.get_best_placement(features.board, mino, features)
+        if move[0] is None:
+            break
+        positions.append((features, mino))
+        features, _ = features.placed(mino, *move).cleared()
+    return positions
+
+
+def bench_games(results, repeat):
+    seconds, pieces = best_time(play_benchmark_games, repeat)
+    results['headless_pieces_per_sec'] = (pieces / seconds, 'pieces/s', True)
+
+
+def bench_batch(results, repeat):
+    def play():
+        sim = BatchSimulator([TOP_GENE_WEIGHTS] * 32, list(range(32)))
+        sim.run()
+        return sim.pieces_dropped.sum()
+    seconds, pieces = best_time(play, repeat)
+    results['batch_pieces_per_sec'] = (pieces / seconds, 'pieces/s', True)
+
+
+def bench_placements(results, repeat):
+    positions = collect_positions()
+    for beam_width in [0, 8]:
+        ai = Genetic_AI(genotype=np.array(TOP_GENE_WEIGHTS), beam_width=beam_width)
+
+        def search():
+            for features, mino in positions:
+                ai.get_best_placement(features.board, mino, features, next_mino=mino)
+            return len(positions)
+        seconds, moves = best_time(search, repeat)
+        results[f'move_ms_beam_{beam_width}'] = (seconds / moves * 1000, 'ms/move', False)
+
+    ai = Genetic_AI(genotype=np.array(TOP_GENE_WEIGHTS))
+
+    def rate():
+        return sum(len(ai.rate_placements(features, mino)[0]) for features, mino in positions)
+    seconds, placements = best_time(rate, repeat)
+    results['placements_per_sec'] = (placements / seconds, 'placements/s', True)
+
+
+def bench_features(results, repeat):
+    positions = collect_positions()
+    rows = np.array([features.board.rows for features, _ in positions])
+    boards = ROW_BITS[rows]
+    peaks = genetic_ai.get_peaks(boards)
+    funcs = {
+        'peaks': lambda: genetic_ai.get_peaks(boards),
+        'holes': lambda: genetic_ai.get_holes(peaks, boards),
+        'wells': lambda: genetic_ai.get_wells(peaks),
+        'bumpiness': lambda: genetic_ai.get_bumpiness(peaks),
+        'row_transitions': lambda: genetic_ai.get_row_transition(boards, None),
+        'col_transitions': lambda: genetic_ai.get_col_transition(boards, peaks),
+        'all_ratings': lambda: genetic_ai.get_ratings(boards, np.zeros(len(boards))),
+        'incremental_ratings': lambda: [features.ratings() for features, _ in positions],
+    }
+    for name, func in funcs.items():
+        seconds, _ = best_time(func, repeat, number=20)
+        results[f'feature_{name}_us_per_board'] = (seconds / len(positions) * 1e6, 'us/board', False)
+
+
+def bench_epoch(results, repeat):
+    def epoch():
+        random.seed(0)
+        np.random.seed(0)
+        with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            train.run(num_epochs=1, num_trials=1, pop_size=20, num_elite=2,
+                      logging_file=str(Path(tmp, "bench.csv")))
+    seconds, _ = best_time(epoch, repeat)
+    results['epoch_seconds'] = (seconds, 's', False)
+
+
+BENCHMARKS = {
+    'games': bench_games,
+    'batch': bench_batch,
+    'placements': bench_placements,
+    'features': bench_features,
+    'epoch': bench_epoch,
+}
+
+
+def run(names=None, repeat=3):
+    """
+    Runs the named benchmarks (all by default), returning a JSON ready report
+    """
+    results = {}
+    for name in names or BENCHMARKS:
+        BENCHMARKS[name](results, repeat)
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'metrics': {name: {'value': value, 'unit': unit, 'higher_is_better': higher}
+                    for name, (value, unit, higher) in results.items()},
+    }
+
+
+def compare(report, baseline, tolerance=TOLERANCE):
+    """
+    Prints every metric next to the baseline, returns the names of regressed metrics
+    """
+    regressions = []
+    print(f"{'metric':<40}{'baseline':>14}{'current':>14}{'change':>10}")
+    for name, metric in report['metrics'].items():
+        base = baseline['metrics'].get(name)
+        if base is None:
+            print(f"{name:<40}{'-':>14}{metric['value']:>14.4g}")
+            continue
+        change = metric['value'] / base['value'] - 1
+        worse = -change if metric['higher_is_better'] else change
+        flag = '  REGRESSION' if worse > tolerance else ''
+        if flag:
+            regressions.append(name)
+        print(f"{name:<40}{base['value']:>14.4g}{metric['value']:>14.4g}{change:>+10.1%}{flag}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks of the simulator and AI hot paths")
+    parser.add_argument('benchmarks', nargs='*', help=f"benchmarks to run, any of {', '.join(BENCHMARKS)}, default all")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per benchmark, the best is kept")
+    parser.add_argument('--output', help="write the report to this JSON file")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="baseline JSON file to compare against")
+    parser.add_argument('--save-baseline', action='store_true', help="store the report as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help="relative change reported as a regression")
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    report = run(args.benchmarks, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif Path(args.baseline).exists():
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            raise SystemExit(f"{len(regressions)} metric(s) regressed: {', '.join(regressions)}")
+    else:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,190 @@
+from collections import namedtuple
+
+from mino import tetrimino
+
+WIDTH = 10      # Board width
+HEIGHT = 21     # Board height including the hidden spawn row
+FULL_ROW = (1 << WIDTH) - 1
+
+
+def build_piece_masks():
+    """
+    Precomputes row masks for every tetrimino.mino_map rotation
+    key=piece_id value=[{x: ((row_offset, row_mask), ...)} for each rotation]
+    only x positions that keep every cell inside the board are present
+    """
+    masks = {}
+    for mino, rotations in enumerate(tetrimino.mino_map, start=1):
+        masks[mino] = []
+        for grid in rotations:
+            cells = [(i, j) for i in range(4) for j in range(4) if grid[i][j] != 0]
+            cols = [j for _, j in cells]
+            by_x = {}
+            for x in range(-min(cols), WIDTH - max(cols)):
+                rows = {}
+                for i, j in cells:
+                    rows[i] = rows.get(i, 0) | (1 << (x + j))
+                by_x[x] = tuple(sorted(rows.items()))
+            masks[mino].append(by_x)
+    return masks
+
+
+def build_piece_columns():
+    """
+    Precomputes the columns of every tetrimino.mino_map rotation
+    key=piece_id value=[((col_offset, top_row_offset, n_cells), ...) for each rotation]
+    """
+    columns = {}
+    for mino, rotations in enumerate(tetrimino.mino_map, start=1):
+        columns[mino] = []
+        for grid in rotations:
+            cols = []
+            for j in range(4):
+                cells = [i for i in range(4) if grid[i][j] != 0]
+                if cells:
+                    cols.append((j, cells[0], len(cells)))
+            columns[mino].append(tuple(cols))
+    return columns
+
+
+# Legal drops of one rotation: x positions inside the board, occupied (row, col)
+# cells and the skyline, the lowest cell (col_offset, row_offset) of every column
+Placement = namedtuple('Placement', ['rotation', 'xs', 'cells', 'skyline'])
+
+
+def build_placement_tables():
+    """
+    Precomputes the distinct placements of every piece
+    key=piece_id value=[Placement for each rotation with a distinct shape]
+    rotations that only shift the shape of an earlier one are left out
+    """
+    tables = {}
+    for mino, rotations in enumerate(tetrimino.mino_map, start=1):
+        tables[mino] = []
+        shapes = set()
+        for rotation, grid in enumerate(rotations):
+            cells = tuple((i, j) for i in range(4) for j in range(4) if grid[i][j] != 0)
+            top = min(i for i, _ in cells)
+            left = min(j for _, j in cells)
+            shape = frozenset((i - top, j - left) for i, j in cells)
+            if shape in shapes:
+                continue
+            shapes.add(shape)
+            cols = [j for _, j in cells]
+            skyline = tuple((j, max(i for i, c in cells if c == j)) for j in sorted(set(cols)))
+            xs = range(-min(cols), WIDTH - max(cols))
+            tables[mino].append(Placement(rotation, xs, cells, skyline))
+    return tables
+
+
+PIECE_MASKS = build_piece_masks()
+PIECE_COLUMNS = build_piece_columns()
+PLACEMENT_TABLES = build_placement_tables()
+
+
+class Bitboard:
+    """
+    Immutable board stored as HEIGHT integers, one per row from top to bottom,
+    where bit x of a row is set when column x is occupied. Placing a piece or
+    clearing lines returns a new board, so a board can be shared freely
+    """
+    __slots__ = ('rows',)
+
+    def __init__(self, rows=None):
+        self.rows = (0,) * HEIGHT if rows is None else tuple(rows)
+
+    def __eq__(self, other):
+        return isinstance(other, Bitboard) and self.rows == other.rows
+
+    def __hash__(self):
+        return hash(self.rows)
+
+    @classmethod
+    def from_matrix(cls, matrix):
+        """
+        Builds a bitboard from a Pytris matrix (matrix[x][y])
+        """
+        rows = [0] * HEIGHT
+        for x, column in enumerate(matrix):
+            bit = 1 << x
+            for y, cell in enumerate(column):
+                if cell != 0:
+                    rows[y] |= bit
+        return cls(rows)
+
+    def to_matrix(self, fill=1):
+        """
+        Converts back to a Pytris matrix, occupied cells get the value fill
+        """
+        return [[fill if row >> x & 1 else 0 for row in self.rows] for x in range(WIDTH)]
+
+    def peaks(self):
+        """
+        Column heights, found by scanning rows from the top
+        until every column has been reached
+        """
+        peaks = [0] * WIDTH
+        remaining = FULL_ROW
+        for y, row in enumerate(self.rows):
+            top = row & remaining
+            if top:
+                remaining ^= top
+                for x in range(WIDTH):
+                    if top >> x & 1:
+                        peaks[x] = HEIGHT - y
+                if not remaining:
+                    break
+        return peaks
+
+    # Returns true if mino would overlap blocks or leave the board at (x, y)
+    def collides(self, mino, rotation, x, y):
+        masks = PIECE_MASKS[mino][rotation].get(x)
+        if masks is None:
+            return True
+        rows = self.rows
+        for i, mask in masks:
+            row = y + i
+            if row >= HEIGHT or rows[row] & mask:
+                return True
+        return False
+
+    # Returns the y where mino comes to rest when dropped from y
+    def drop_y(self, mino, rotation, x, y=0):
+        while not self.collides(mino, rotation, x, y + 1):
+            y += 1
+        return y
+
+    # Returns the y where mino comes to rest when hard dropped from the top,
+    # or None when it can't enter the board there. peaks are the column heights
+    def landing_y(self, placement: Placement, mino, x, peaks):
+        y = HEIGHT
+        for j, bottom in placement.skyline:
+            rest = HEIGHT - 1 - peaks[x + j] - bottom
+            if rest < y:
+                y = rest
+        if y >= 0:
+            return y
+        # A column reaches into the spawn rows, only the full check can tell
+        if self.collides(mino, placement.rotation, x, 0):
+            return None
+        return self.drop_y(mino, placement.rotation, x)
+
+    # Returns a new board with mino written into it
+    def placed(self, mino, rotation, x, y):
+        rows = list(self.rows)
+        for i, mask in PIECE_MASKS[mino][rotation][x]:
+            rows[y + i] |= mask
+        return Bitboard(rows)
+
+    def count_full_rows(self):
+        return self.rows.count(FULL_ROW)
+
+    # Returns a new board without full rows and how many rows were removed
+    def cleared(self):
+        rows = self.rows
+        if FULL_ROW not in rows:
+            return self, 0
+        kept = [row for row in rows if row != FULL_ROW]
+        erase_count = HEIGHT - len(kept)
+        # Pytris shifts rows down without emptying the hidden top row, mirror that
+        return Bitboard([rows[0]] * erase_count + kept), erase_count
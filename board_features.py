@@ -0,0 +1,163 @@
+from collections import OrderedDict
+
+from bitboard import Bitboard, PIECE_MASKS, PIECE_COLUMNS, WIDTH, HEIGHT, FULL_ROW
+
+# Set bits of every possible 10-bit row
+POPCOUNT = [bin(row).count('1') for row in range(1 << WIDTH)]
+# Changes between neighbouring columns of every possible 10-bit row
+ROW_TRANSITIONS = [POPCOUNT[(row ^ (row >> 1)) & (FULL_ROW >> 1)] for row in range(1 << WIDTH)]
+
+
+class BoardFeatures:
+    """
+    Bitboard together with the per-column and per-row quantities the
+    genetic_ai ratings are built from. Placing a piece only revisits the
+    columns and rows the piece touches instead of the whole board
+    """
+    __slots__ = ('board', 'peaks', 'filled', 'row_transitions', 'col_changes', 'full_rows')
+
+    def __init__(self, board: Bitboard = None):
+        self.board = Bitboard() if board is None else board
+        rows = self.board.rows
+        self.peaks = self.board.peaks()
+        self.filled = [sum(row >> x & 1 for row in rows) for x in range(WIDTH)]
+        self.row_transitions = sum(ROW_TRANSITIONS[row] for row in rows)
+        self.col_changes = sum(POPCOUNT[rows[y] ^ rows[y + 1]] for y in range(HEIGHT - 1))
+        self.full_rows = rows.count(FULL_ROW)
+
+    # Returns the features of the board with mino written into it,
+    # board may be passed in when the placed bitboard is already known
+    def placed(self, mino, rotation, x, y, board: Bitboard = None):
+        if board is None:
+            board = self.board.placed(mino, rotation, x, y)
+        features = BoardFeatures.__new__(BoardFeatures)
+        features.board = board
+
+        peaks = self.peaks[:]
+        filled = self.filled[:]
+        for j, top, n_cells in PIECE_COLUMNS[mino][rotation]:
+            peak = HEIGHT - y - top
+            if peak > peaks[x + j]:
+                peaks[x + j] = peak
+            filled[x + j] += n_cells
+        features.peaks = peaks
+        features.filled = filled
+
+        old, new = self.board.rows, board.rows
+        masks = PIECE_MASKS[mino][rotation][x]
+        first, last = y + masks[0][0], y + masks[-1][0]
+        row_transitions = self.row_transitions
+        full_rows = self.full_rows
+        for row in range(first, last + 1):
+            row_transitions += ROW_TRANSITIONS[new[row]] - ROW_TRANSITIONS[old[row]]
+            full_rows += (new[row] == FULL_ROW) - (old[row] == FULL_ROW)
+        col_changes = self.col_changes
+        for row in range(max(first - 1, 0), min(last, HEIGHT - 2) + 1):
+            col_changes += POPCOUNT[new[row] ^ new[row + 1]] - POPCOUNT[old[row] ^ old[row + 1]]
+        features.row_transitions = row_transitions
+        features.col_changes = col_changes
+        features.full_rows = full_rows
+        return features
+
+    # Returns the features of the board without full rows and how many rows were removed
+    def cleared(self):
+        board, erase_count = self.board.cleared()
+        if erase_count == 0:
+            return self, 0
+        if self.board.rows[0]:
+            # The hidden top row gets copied down, recount everything
+            return BoardFeatures(board), erase_count
+        # Full rows reach every column and have no row transitions, so every
+        # column loses erase_count cells and the row transition total stays the same
+        features = BoardFeatures.__new__(BoardFeatures)
+        features.board = board
+        rows = board.rows
+        features.peaks = board.peaks()
+        features.filled = [n - erase_count for n in self.filled]
+        features.row_transitions = self.row_transitions
+        features.col_changes = sum(POPCOUNT[rows[y] ^ rows[y + 1]] for y in range(HEIGHT - 1))
+        features.full_rows = 0
+        return features, erase_count
+
+    def ratings(self):
+        """
+        Returns the NUM_FEATURES ratings in the order genetic_ai.get_ratings uses
+        """
+        peaks, filled = self.peaks, self.filled
+        n_holes = 0
+        n_cols_with_holes = 0
+        n_pits = 0
+        bumpiness = 0
+        deepest_well = 0
+        col_transitions = self.col_changes
+        for x in range(WIDTH):
+            peak = peaks[x]
+            holes = peak - filled[x]
+            n_holes += holes
+            if holes > 0:
+                n_cols_with_holes += 1
+            if filled[x] == 0:
+                n_pits += 1
+            if 0 < peak < HEIGHT:
+                col_transitions -= 1   # empty space onto the top block isn't counted
+            left = peaks[x - 1] - peak if x > 0 else 0
+            right = peaks[x + 1] - peak if x < WIDTH - 1 else 0
+            if x < WIDTH - 1:
+                bumpiness += abs(right)
+            well = left if left >= right else right
+            if well > deepest_well:
+                deepest_well = well
+        return [sum(peaks), n_holes, n_cols_with_holes, bumpiness, n_pits,
+                deepest_well, self.row_transitions, col_transitions, self.full_rows * 8]
+
+
+class FeatureCache:
+    """
+    Bounded LRU transposition table from bitboard rows to ratings.
+    Ratings don't depend on the genotype, so one cache can serve every
+    agent evaluated in the same process
+    """
+    def __init__(self, maxsize=100_000):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    # Returns cached ratings of board, or None
+    def get(self, board: Bitboard):
+        ratings = self.entries.get(board.rows)
+        if ratings is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(board.rows)
+        return ratings
+
+    def put(self, board: Bitboard, ratings):
+        self.entries[board.rows] = ratings
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+shared_caches = {}
+
+
+def get_shared_cache(maxsize):
+    """
+    Returns the process wide FeatureCache of the given size
+    """
+    if maxsize not in shared_caches:
+        shared_caches[maxsize] = FeatureCache(maxsize)
+    return shared_caches[maxsize]
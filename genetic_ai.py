@@ -1,26 +1,30 @@
 import numpy as np
-from copy import deepcopy
 import random
- 
+import time
+
+from bitboard import Bitboard, PLACEMENT_TABLES, WIDTH
+from board_features import BoardFeatures, FeatureCache
 # import pytris
 
 NUM_FEATURES = 9
 MUTATION = 0.2
 
-# All possible moves for pieces
+# Names of the features, in genotype order
+FEATURE_NAMES = ['aggregated_height', 'n_holes', 'n_cols_with_holes', 'bumpiness', 'n_pits',
+                 'deepest_well', 'row_transitions', 'col_transitions', 'lines_cleared']
+
+# Best genotype found so far
+#########           aggregated_height       n_holes             n_cols_with_holes       bumpiness               n_pits              deepest_well        row_transitions     col_transitions     lines_cleared
+TOP_GENE_WEIGHTS = [-0.0279403731905886, -0.49807861137057663, -0.003623541808306773, -0.35611209635594987, -2.261251957450068, -0.30014145220851784, 0.0726731091781297, -7.944738378738265, 0.10771263721098738]
+
+# All possible moves for pieces, generated from the placement tables
 # key=piece_id value=[valid x axis start,end]
 POSSIBLE_MOVES = {
-    1: [[0,6+1],[-2,7+1]],                  # I
-    2: [[0,7+1],[-1,7+1],[0,7+1],[0,8+1]],  # J
-    3: [[0,7+1],[-1,7+1],[0,7+1],[0,8+1]],  # L
-    4: [[-1,7+1]],                          # O
-    5: [[0,7+1],[-1,7+1]],                  # S
-    6: [[0,7+1],[-1,7+1],[0,7+1],[0,8+1]],  # T
-    7: [[0,7+1],[-1,7+1]]                   # Z
+    mino: [[p.xs.start, p.xs.stop] for p in placements] for mino, placements in PLACEMENT_TABLES.items()
 }
 
 class Genetic_AI:
-    def __init__(self, genotype=None, mutate=False):
+    def __init__(self, genotype=None, mutate=False, beam_width=0, time_budget=None, cache: FeatureCache = None):
         if genotype is None:
             self.genotype = np.array([random.uniform(-1, 1) for _ in range(NUM_FEATURES)])
         else:
@@ -32,63 +36,101 @@ class Genetic_AI:
         self.fit_score = 0.0
         self.fit_rel = 0.0
 
+        # Lookahead over the next piece, 0 = off
+        self.beam_width = beam_width    # Placements of the current piece searched further
+        self.time_budget = time_budget  # Seconds per move before the search stops expanding
+        self.cache = cache              # Ratings of boards seen before, None = off
+
     def __lt__(self, other: 'pytris.Genetic_AI'):
         return self.fit_score < other.fit_score      
 
     def evaluate_move(self, pytris: 'pytris.Pytris'):
         """
+        Rates the board of a Pytris instance with the agents genotype
         """
         board: np.array = matrix_to_np_board(pytris.matrix)
-        peaks = get_peaks(board)
-        highest_peak = np.max(peaks)
-        holes = get_holes(peaks, board)
-        wells = get_wells(peaks)
-
-        rating_funcs = {
-            'aggregated_height': np.sum(peaks),
-            'n_holes': np.sum(holes),
-            'n_cols_with_holes': np.count_nonzero(np.array(holes) > 0),
-            'bumpiness': get_bumpiness(peaks),
-            'n_pits': np.count_nonzero(np.count_nonzero(board, axis=0) == 0),
-            'deepest_well': np.max(wells),
-            'row_transitions': get_row_transition(board, highest_peak), 
-            'col_transitions': get_col_transition(board, peaks),
-            'lines_cleared': count_lines_cleared(pytris.matrix) * 8
-        } 
-
-        ratings = np.array([*rating_funcs.values()], dtype=float)
+        ratings = get_ratings(board, count_lines_cleared(pytris.matrix))
         return np.dot(self.genotype, ratings)
 
-
     def get_best_move(self, pytris: 'pytris.Pytris'):
         """
         Gets the best for move an agents base on board, next piece, and genotype
         """
-        current_board = deepcopy(pytris.matrix)
+        return self.get_best_placement(Bitboard.from_matrix(pytris.matrix), pytris.mino,
+                                       next_mino=pytris.next_mino)
+
+    def rate_placements(self, features: BoardFeatures, mino):
+        """
+        Returns every (rotation, x, y) placement of mino, the resulting
+        boards and their scores
+        """
+        moves = []
+        boards = []
+        ratings = []
+        cache = self.cache
+        for r, x, y, board in get_placements(features.board, mino, features.peaks):
+            moves.append((r, x, y))
+            boards.append(board)
+            rating = None if cache is None else cache.get(board)
+            if rating is None:
+                rating = features.placed(mino, r, x, y, board).ratings()
+                if cache is not None:
+                    cache.put(board, rating)
+            ratings.append(rating)
+        if not moves:
+            return moves, boards, np.empty(0)
+        return moves, boards, np.array(ratings, dtype=float) @ self.genotype
+
+    def get_best_placement(self, board: Bitboard, mino, features: BoardFeatures = None, next_mino=None):
+        """
+        Gets the best (rotation, x, y) placement of mino on a bitboard,
+        all values are None when the piece can't be placed anywhere.
+        Candidates are rated incrementally from the features of board,
+        pass them in when they are kept up to date by the caller.
+        With a beam_width and next_mino the best beam_width placements are
+        searched one piece deeper, best first, until time_budget runs out
+        """
+        if features is None:
+            features = BoardFeatures(board)
+        moves, boards, scores = self.rate_placements(features, mino)
+        if not moves:
+            return None, None, None
+        best = np.argmax(scores)
+        if not self.beam_width or next_mino is None:
+            return moves[best]
+
+        deadline = None if self.time_budget is None else time.perf_counter() + self.time_budget
         max_value = -np.inf
-        best_rotation = None
-        best_x = None
-        best_y = None
-
-        for r in range(len(POSSIBLE_MOVES[pytris.mino])):
-            pytris.rotation = r
-            for x in range(*POSSIBLE_MOVES[pytris.mino][r]):
-                pytris.dx, pytris.dy = x, 0
-                if not pytris.is_stackable():   # check if move is possible
-                    continue
-                # move piece to bottom
-                while not pytris.is_bottom(pytris.dx, pytris.dy):
-                    pytris.dy += 1
-                pytris.draw_mino()
-                evaluation = self.evaluate_move(pytris)
-                if evaluation > max_value:
-                    max_value = evaluation
-                    best_rotation = r
-                    best_x = x
-                    best_y = pytris.dy
-                pytris.matrix = deepcopy(current_board)
-        pytris.matrix = current_board   # reset board to state before generating moves
-        return best_rotation, best_x, best_y
+        for i in np.argsort(-scores, kind='stable')[:self.beam_width]:
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+            after, erase_count = features.placed(mino, *moves[i], boards[i]).cleared()
+            _, _, next_scores = self.rate_placements(after, next_mino)
+            if not len(next_scores):    # next piece would top out
+                continue
+            # Lines cleared by the first piece are gone from the second board, credit them here
+            value = np.max(next_scores) + self.genotype[-1] * erase_count * 8
+            if value > max_value:
+                max_value = value
+                best = i
+        return moves[best]
+
+
+def get_placements(board: Bitboard, mino, peaks=None):
+    """
+    Yields every (rotation, x, landing_y, resulting board) placement of mino,
+    the given board and the game it came from are never modified.
+    Landing heights come from the column heights, pass them in when known
+    """
+    if peaks is None:
+        peaks = board.peaks()
+    for placement in PLACEMENT_TABLES[mino]:
+        r = placement.rotation
+        for x in placement.xs:
+            y = board.landing_y(placement, mino, x, peaks)
+            if y is None:   # move isn't possible
+                continue
+            yield r, x, y, board.placed(mino, r, x, y)
 
 def count_lines_cleared(matrix):
     erase_count = 0
@@ -108,74 +150,70 @@ def matrix_to_np_board(matrix):
     return board
 
 
+# Cells of every possible 10-bit row, ROW_BITS[row][x] == 1 when column x is set
+ROW_BITS = (np.arange(1 << WIDTH)[:, None] >> np.arange(WIDTH)) & 1
+
+
+def get_ratings(board, lines_cleared):
+    """
+    Computes the NUM_FEATURES ratings of a (rows, cols) 0/1 board,
+    or of a (boards, rows, cols) stack giving a (boards, NUM_FEATURES) array
+    """
+    peaks = get_peaks(board)
+    highest_peak = np.max(peaks, axis=-1)
+    holes = get_holes(peaks, board)
+    wells = get_wells(peaks)
+
+    rating_funcs = {
+        'aggregated_height': np.sum(peaks, axis=-1),
+        'n_holes': np.sum(holes, axis=-1),
+        'n_cols_with_holes': np.count_nonzero(holes > 0, axis=-1),
+        'bumpiness': get_bumpiness(peaks),
+        'n_pits': np.count_nonzero(np.count_nonzero(board, axis=-2) == 0, axis=-1),
+        'deepest_well': np.max(wells, axis=-1),
+        'row_transitions': get_row_transition(board, highest_peak), 
+        'col_transitions': get_col_transition(board, peaks),
+        'lines_cleared': np.asarray(lines_cleared) * 8
+    } 
+
+    return np.stack([*rating_funcs.values()], axis=-1).astype(float)
+
+
+# Feature functions work on a single (rows, cols) board or a stack of boards,
+# the board axes are always the last two and the column axis of peaks is the last
+
+
 def get_peaks(area):
-    peaks = np.array([])
-    for col in range(area.shape[1]):
-        if 1 in area[:, col]:
-            p = area.shape[0] - np.argmax(area[:, col], axis=0)
-            peaks = np.append(peaks, p)
-        else:
-            peaks = np.append(peaks, 0)
-    return peaks
+    filled = np.any(area, axis=-2)
+    return np.where(filled, area.shape[-2] - np.argmax(area, axis=-2), 0)
 
 
 def get_row_transition(area, highest_peak):
-    sum = 0
-    # From highest peak to bottom
-    for row in range(int(area.shape[0] - highest_peak), area.shape[0]):
-        for col in range(1, area.shape[1]):
-            if area[row, col] != area[row, col - 1]:
-                sum += 1
-    return sum
+    # Rows above the highest peak are empty, so counting every row gives the
+    # same sum as counting from highest peak to bottom
+    return np.count_nonzero(area[..., 1:] != area[..., :-1], axis=(-2, -1))
 
 
 def get_col_transition(area, peaks):
-    sum = 0
-    for col in range(area.shape[1]):
-        if peaks[col] <= 1:
-            continue
-        for row in range(int(area.shape[0] - peaks[col]), area.shape[0] - 1):
-            if area[row, col] != area[row + 1, col]:
-                sum += 1
-    return sum
+    # Count from peaks to bottom, the step from empty space onto the top block
+    # of each column is not a transition
+    changes = np.count_nonzero(area[..., 1:, :] != area[..., :-1, :], axis=(-2, -1))
+    return changes - np.count_nonzero((peaks > 0) & (peaks < area.shape[-2]), axis=-1)
 
 
 def get_bumpiness(peaks):
-    s = 0
-    for i in range(9):
-        s += np.abs(peaks[i] - peaks[i + 1])
-    return s
+    return np.sum(np.abs(np.diff(peaks, axis=-1)), axis=-1)
 
 
 def get_holes(peaks, area):
-    # Count from peaks to bottom
-    holes = []
-    for col in range(area.shape[1]):
-        start = -peaks[col]
-        # If there's no holes i.e. no blocks on that column
-        if start == 0:
-            holes.append(0)
-        else:
-            holes.append(np.count_nonzero(area[int(start) :, col] == 0))
-    return holes
+    # Every empty cell below a columns peak is a hole
+    return peaks - np.count_nonzero(area, axis=-2)
 
 
 def get_wells(peaks):
-    wells = []
-    for i in range(len(peaks)):
-        if i == 0:
-            w = peaks[1] - peaks[0]
-            w = w if w > 0 else 0
-            wells.append(w)
-        elif i == len(peaks) - 1:
-            w = peaks[-2] - peaks[-1]
-            w = w if w > 0 else 0
-            wells.append(w)
-        else:
-            w1 = peaks[i - 1] - peaks[i]
-            w2 = peaks[i + 1] - peaks[i]
-            w1 = w1 if w1 > 0 else 0
-            w2 = w2 if w2 > 0 else 0
-            w = w1 if w1 >= w2 else w2
-            wells.append(w)
-    return wells
+    # Depth below the higher neighbour, edge columns only have one neighbour
+    steps = np.diff(peaks, axis=-1)
+    edge = np.zeros(peaks.shape[:-1] + (1,), dtype=steps.dtype)
+    left = np.concatenate([edge, -steps], axis=-1)
+    right = np.concatenate([steps, edge], axis=-1)
+    return np.maximum(np.maximum(left, right), 0)
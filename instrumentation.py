@@ -0,0 +1,142 @@
+import json
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+
+import genetic_ai
+from bitboard import Bitboard
+from board_features import BoardFeatures
+
+# Opt-in timing of the training hot paths. enable() swaps the hot functions
+# for timed wrappers, while disabled the original functions run untouched.
+# move_generation includes the collision checks done while generating moves,
+# collision covers the landing searches and the spawn check of every piece
+
+# (section, owner, attribute, is_generator)
+HOT_PATHS = [
+    ('move_generation', genetic_ai, 'get_placements', True),
+    ('collision', Bitboard, 'landing_y', False),
+    ('collision', Bitboard, 'collides', False),
+    ('feature_extraction', BoardFeatures, 'placed', False),
+    ('feature_extraction', BoardFeatures, 'ratings', False),
+    ('line_clearing', BoardFeatures, 'cleared', False),
+]
+
+enabled = False
+seconds = defaultdict(float)    # Time spent per section
+calls = defaultdict(int)        # Calls per section
+active = set()                  # Sections being timed, calls nested in one aren't timed again
+originals = {}
+
+
+def timed(name, func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if name in active:  # e.g. collides called by landing_y
+            return func(*args, **kwargs)
+        active.add(name)
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            seconds[name] += perf_counter() - start
+            calls[name] += 1
+            active.discard(name)
+    return wrapper
+
+
+def timed_generator(name, func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        items = func(*args, **kwargs)
+        calls[name] += 1
+        while True:
+            start = perf_counter()
+            try:
+                item = next(items)
+            except StopIteration:
+                seconds[name] += perf_counter() - start
+                return
+            seconds[name] += perf_counter() - start
+            yield item
+    return wrapper
+
+
+def enable():
+    """
+    Starts timing the hot paths of this process
+    """
+    global enabled
+    if enabled:
+        return
+    for name, owner, attribute, is_generator in HOT_PATHS:
+        func = owner.__dict__[attribute]
+        originals[(owner, attribute)] = func
+        setattr(owner, attribute, (timed_generator if is_generator else timed)(name, func))
+    enabled = True
+
+
+def disable():
+    global enabled
+    for (owner, attribute), func in originals.items():
+        setattr(owner, attribute, func)
+    originals.clear()
+    enabled = False
+
+
+@contextmanager
+def section(name):
+    """
+    Times a block of code as section name when timing is enabled
+    """
+    if not enabled:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        seconds[name] += perf_counter() - start
+        calls[name] += 1
+
+
+def collect():
+    """
+    Returns {section: (seconds, calls)} gathered since the last collect and resets the counters
+    """
+    sections = {name: (seconds[name], calls[name]) for name in seconds}
+    seconds.clear()
+    calls.clear()
+    return sections
+
+
+def merge(total, sections):
+    for name, (spent, count) in sections.items():
+        spent_total, count_total = total.get(name, (0.0, 0))
+        total[name] = (spent_total + spent, count_total + count)
+    return total
+
+
+def write_epoch(path, epoch, sections, games):
+    """
+    Appends one epoch of profile data as a JSON line. games holds the
+    train.GameResult of every game played, grouped by agent
+    """
+    agents = []
+    for agent_games in games:
+        pieces = sum(game.pieces for game in agent_games)
+        seconds = sum(game.seconds for game in agent_games)
+        agents.append({'games': len(agent_games), 'pieces': pieces / len(agent_games),
+                       'pieces_per_sec': pieces / seconds if seconds else 0.0})
+    pieces = sum(game.pieces for agent_games in games for game in agent_games)
+    seconds = sum(game.seconds for agent_games in games for game in agent_games)
+    record = {
+        'epoch': epoch,
+        'sections': {name: {'seconds': spent, 'calls': count} for name, (spent, count) in sections.items()},
+        'pieces': pieces,
+        'pieces_per_sec': pieces / seconds if seconds else 0.0,
+        'agents': agents,
+    }
+    with open(path, 'a', encoding='UTF8') as f:
+        f.write(json.dumps(record) + '\n')
@@ -0,0 +1,105 @@
+import random
+import time
+from multiprocessing import Process, Queue
+from queue import Empty
+from pathlib import Path
+import numpy as np
+
+from train import compute_population_fitness, next_generation, random_population, start_log, log_epoch
+
+
+def migrate(population, fitness, inbox, outbox, num_migrants):
+    """
+    Sends copies of the num_migrants best agents to the next island and puts the
+    migrants of the previous island in place of the worst agents, returning the
+    new population and fitness. Migrants keep the fitness measured on their island
+    """
+    order = np.argsort(fitness, kind='stable')
+    best = order[::-1][:num_migrants]
+    outbox.put((population[best], fitness[best]))
+    genotypes, migrant_fitness = inbox.get()
+    worst = order[:len(genotypes)]
+    population = population.copy()
+    fitness = np.array(fitness, dtype=float)
+    population[worst] = genotypes
+    fitness[worst] = migrant_fitness
+    return population, fitness
+
+
+def evolve_island(index, seed, inbox, outbox, results, num_epochs, num_trials, pop_size, num_elite, survival_rate,
+                  logging_file, migration_interval, num_migrants, game_options):
+    """
+    Evolves the population of one island, exchanging migrants with its neighbours
+    every migration_interval epochs. Runs in its own process
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    data = start_log(logging_file)
+    population = random_population(pop_size)
+    for epoch in range(num_epochs):
+        fitness, games = compute_population_fitness(population, num_trials, **game_options)
+        if num_migrants and (epoch + 1) % migration_interval == 0:
+            population, fitness = migrate(population, fitness, inbox, outbox, num_migrants)
+        population, data = next_generation(population, fitness, num_elite, survival_rate)
+        log_epoch(logging_file, data)
+        results.put((index, epoch, data))
+
+
+def run(num_islands=4, num_epochs=20, num_trials=3, pop_size=100, num_elite=5, survival_rate=.35,
+        logging_file=f"run_at_{int(time.time())}.csv", migration_interval=5, num_migrants=2, seed=None,
+        beam_width=0, cache_size=0, batch_size=0, common_pieces=False):
+    """
+    Island model: num_islands populations of pop_size agents evolve in parallel
+    processes with the train.py selection, elite and crossover rules. Every
+    migration_interval epochs each island sends its num_migrants best agents to
+    the next island of a ring, where they replace the worst agents.
+    Island i logs to logging_file with an .island<i> suffix. Islands trade
+    migrants in lockstep, so a fixed seed makes the run reproducible.
+    Returns the last CSV row of every island
+    """
+    if num_migrants >= pop_size - num_elite:
+        raise ValueError("num_migrants must leave room for the elite and the rest of the population")
+    if batch_size and (beam_width or cache_size):
+        raise ValueError("Batched games don't support lookahead or the ratings cache")
+    game_options = {'beam_width': beam_width, 'cache_size': cache_size, 'batch_size': batch_size,
+                    'common_pieces': common_pieces}
+    # islands get seeds of their own, forked processes would otherwise share the random state
+    rng = random.Random(seed)
+    seeds = [rng.getrandbits(32) for _ in range(num_islands)]
+    path = Path(logging_file)
+    queues = [Queue() for _ in range(num_islands)]     # queues[i] holds the migrants arriving on island i
+    results = Queue()
+    islands = [Process(target=evolve_island,
+                       args=(i, seeds[i], queues[i], queues[(i + 1) % num_islands], results, num_epochs, num_trials,
+                             pop_size, num_elite, survival_rate, str(path.with_suffix(f'.island{i}{path.suffix}')),
+                             migration_interval, num_migrants if num_islands > 1 else 0, game_options))
+               for i in range(num_islands)]
+    for island in islands:
+        island.start()
+
+    last_data = [None] * num_islands
+    received = 0
+    try:
+        while received < num_islands * num_epochs:
+            try:
+                index, epoch, data = results.get(timeout=1)
+            except Empty:
+                # a crashed island would leave its neighbours waiting for migrants forever
+                if any(island.exitcode not in (None, 0) for island in islands):
+                    raise RuntimeError("An island process failed")
+                continue
+            received += 1
+            last_data[index] = data
+            print(f'island={index}\t{epoch=}\ttotal fitness={data[0]}\tbest agent={data[2]}')
+    except BaseException:
+        for island in islands:
+            island.terminate()
+        raise
+    finally:
+        for island in islands:
+            island.join()
+    return last_data
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,54 @@
+import queue
+import threading
+
+from bitboard import Bitboard
+from genetic_ai import Genetic_AI
+
+
+class MoveWorker:
+    """
+    Runs the placement search of an agent on a background thread, so the game
+    loop keeps rendering while the agent thinks. A search is requested as soon
+    as the board it will run on is known, usually while the piece before it is
+    still falling, and its result is picked up with take when the piece spawns
+    """
+    def __init__(self, ai: Genetic_AI):
+        self.ai = ai
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.pending = 0
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    def work(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            board, mino, next_mino = request
+            self.results.put((request, self.ai.get_best_placement(board, mino, next_mino=next_mino)))
+
+    # Starts searching the placement of mino on board, next_mino being the piece after it
+    def submit(self, board: Bitboard, mino, next_mino=None):
+        self.requests.put((board, mino, next_mino))
+        self.pending += 1
+
+    def take(self, board: Bitboard, mino, next_mino=None):
+        """
+        Returns the (rotation, x, y) placement of mino on board, waiting for the
+        search submitted for it. When the game went differently than predicted
+        the placement is searched right away instead
+        """
+        move = None
+        while self.pending:
+            request, result = self.results.get()
+            self.pending -= 1
+            if request == (board, mino, next_mino):
+                move = result
+        if move is None:
+            move = self.ai.get_best_placement(board, mino, next_mino=next_mino)
+        return move
+
+    def stop(self):
+        self.requests.put(None)
+        self.thread.join()
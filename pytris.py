@@ -1,111 +1,100 @@
 import pygame
 from pygame.locals import *
 import operator
-import random
+import time
 from pathlib import Path
 import numpy as np
 
-from genetic_ai import Genetic_AI     
+from genetic_ai import Genetic_AI, TOP_GENE_WEIGHTS
 from ui_variables import UI_variables
 from mino import *
-from genetic_ai import Genetic_AI
+from pytris_core import PytrisCore
+from bitboard import Bitboard, WIDTH, HEIGHT
+from board_features import BoardFeatures
+from move_worker import MoveWorker
+
+
+class ColorBoard:
+    """
+    Block colors of a headless game, kept up to date by passing it to
+    PytrisCore.place_headless as the recorder. Bitboards only know which
+    cells are occupied, turbo mode needs the colors to draw the board
+    """
+    def __init__(self):
+        self.rows = [[0] * WIDTH for _ in range(HEIGHT)]
+
+    def start_game(self):
+        self.rows = [[0] * WIDTH for _ in range(HEIGHT)]
+
+    def record(self, mino, rotation, x, y, lines_cleared, board=None):
+        grid = tetrimino.mino_map[mino - 1][rotation]
+        for i in range(4):
+            for j in range(4):
+                if grid[i][j] != 0:
+                    self.rows[y + i][x + j] = grid[i][j]
+        if lines_cleared:
+            kept = [row for row in self.rows if 0 in row]
+            # Like Pytris, cleared rows are replaced by copies of the hidden top row
+            self.rows = [self.rows[0][:] for _ in range(lines_cleared)] + kept
 
-class Pytris:
+    # Returns the colors as a Pytris matrix (matrix[x][y])
+    def to_matrix(self):
+        return [list(column) for column in zip(*self.rows)]
+
+class Pytris(PytrisCore):
     block_size = 17 # Height, width of single block
-    width = 10      # Board width
-    height = 20     # Board height
     clock = None
     screen = None
     headless = False
 
-    def default_values(self):
-        self.score_multiplier = [0, 50, 150, 350, 1000]
-        self.score = 0      # Total score during one game
-        self.level = 1      # Current level
-        self.goal = 10      # Lines per level
-        self.lines = 0      # Total lines done during one game
-        self.bottom_count = 0   # Counter for block to stay in place
-        self.hard_drop = False
-        
-        self.fall_time = 100  # Bigger -> Slower
-
-        # Initial values
-        self.blink = False      # Used for blinking effect
-        self.start = False      # True when game is being played
-        self.pause = False      # True when game is paused
-        self.done = False       # True when user quits game
-        self.game_over = False  # True when game over
-        
-        self.dx, self.dy = 3, 0     # Minos location status
-        self.rotation = 0           # Minos rotation status
-        self.bag = [1, 2, 3, 4, 5, 6, 7]            # Bag with minos
-        self.mino = self.get_mino_from_bag()        # Current mino
-        self.next_mino = self.get_mino_from_bag()   # Next mino
-        
-        self.hold = False        # Hold status
-        self.hold_mino = None    # Holded mino
-
-        self.ai: Genetic_AI = None  # Agent playing (None = human player)
+    leaderboard_path = Path(Path(__file__).parent.absolute(), "leaderboard.txt")
+    leaders = None  # Sorted (name, score) pairs, loaded once when the game is shown
 
+    def default_values(self):
+        super().default_values()
         self.name_location = 0
         self.name = [65, 65, 65]
-        
-        self.matrix = [[0 for y in range(self.height + 1)] for x in range(self.width)] # Board matrix
-
-        self.leaders = {'AAA': 0, 'BBB': 0, 'CCC': 0}
-        for i in [line.rstrip('\n') for line in open(Path(Path(__file__).parent.absolute(), "leaderboard.txt"))]:
-            self.leaders[i.split(' ')[0]] = int(i.split(' ')[1])
-        self.leaders = sorted(self.leaders.items(), key=operator.itemgetter(1), reverse=True)
-
-    def __init__(self, ai:Genetic_AI=None, headless=False):
-        self.default_values()
-        if ai:
-            self.ai = ai
-            self.start = True
+        self.rendered = None    # What draw_board last put on screen, None = repaint everything
+        self.dirty_rects = []   # Screen areas changed since the last display update
+
+    # Reads the leaderboard file once per process
+    def load_leaders(self):
+        if Pytris.leaders is None:
+            scores = {'AAA': 0, 'BBB': 0, 'CCC': 0}
+            for i in [line.rstrip('\n') for line in open(self.leaderboard_path)]:
+                scores[i.split(' ')[0]] = int(i.split(' ')[1])
+            Pytris.leaders = sorted(scores.items(), key=operator.itemgetter(1), reverse=True)
+        return Pytris.leaders
+
+    # Appends a score to the leaderboard file and the loaded leaders
+    def save_score(self, name, score):
+        outfile = open(self.leaderboard_path, 'a')
+        outfile.write(name + ' ' + str(score) + '\n')
+        outfile.close()
+        scores = dict(self.load_leaders())
+        scores[name] = score
+        Pytris.leaders = sorted(scores.items(), key=operator.itemgetter(1), reverse=True)
+
+    def __init__(self, ai:Genetic_AI=None, headless=False, seed=None):
+        super().__init__(ai=ai, seed=seed)
         if headless:
             self.headless = True
-        else:
-            pygame.init()
-            self.ui_vars = UI_variables()
-
-    def run_headless(self):
-        if self.ai is None:
-            return "Can't run instance with no AI!"
-        for pieces_dropped in range(500):    # Do N pieces maximum
-            self.rotation, self.dx, self.dy = self.ai.get_best_move(self)
-            self.draw_mino()
-            erase_count = 0
-            for j in range(21):
-                is_full = True
-                for i in range(10):
-                    if self.matrix[i][j] == 0:
-                        is_full = False
-                if is_full:
-                    erase_count += 1
-                    k = j
-                    while k > 0:
-                        for i in range(10):
-                            self.matrix[i][k] = self.matrix[i][k - 1]
-                        k -= 1
-            self.score += self.score_multiplier[erase_count] * self.level
-            self.lines += erase_count
-            self.mino, self.next_mino = self.next_mino, self.get_mino_from_bag()
-            self.dx, self.dy = 3, 0
-            self.rotation = 0
-            if not self.is_stackable():
-                break
-        return self.score
 
     def run(self):
         if self.headless:
             return "Can't run instance with of option 'headless' ON!"
 
+        pygame.init()
+        self.ui_vars = UI_variables()
+        self.build_surfaces()
+        self.load_leaders()
         self.clock = pygame.time.Clock()
         self.screen = pygame.display.set_mode((300, 374))
         pygame.display.set_caption("PYTRIS™")
         
         self.ai: Genetic_AI = self.ai
         if self.ai:
+            self.move_worker = MoveWorker(self.ai)
             pygame.time.set_timer(pygame.USEREVENT, 100)
         else:
             pygame.time.set_timer(pygame.USEREVENT, self.fall_time * 10)
@@ -133,6 +122,7 @@ class Pytris:
                         else:
                             self.blink = True
                         pygame.display.update()
+                        self.invalidate_board()
                     elif event.type == KEYDOWN:
                         self.erase_mino()
                         if event.key == K_ESCAPE:
@@ -175,7 +165,9 @@ class Pytris:
                                 self.hard_drop = False
                                 self.bottom_count = 0
                                 self.score += 10 * self.level
+                                self.pieces += 1
                                 self.draw_mino()
+                                self.ghost_key = None   # The piece locked, the next drop lands on a new board
                                 self.draw_board()
                                 self.dx, self.dy = 3, 0
                                 self.rotation = 0
@@ -183,16 +175,14 @@ class Pytris:
                                     self.mino, self.next_mino = self.next_mino, self.get_mino_from_bag()
                                     self.hold = False
                                     if self.ai:
-                                        self.rotation, self.dx, _ = self.ai.get_best_move(self)
+                                        self.next_ai_move()
                                 else:
                                     self.start = False
                                     self.game_over = True
                                     self.print_stats()
                                     pygame.time.set_timer(pygame.USEREVENT, 1)
                                     if self.ai:
-                                        outfile = open(Path(Path(__file__).parent.absolute(),"leaderboard.txt"),'a')
-                                        outfile.write("AlgoBot " + str(self.score) + '\n')
-                                        outfile.close()
+                                        self.save_score("AlgoBot", self.score)
                             else:
                                 self.bottom_count += 1
 
@@ -339,7 +329,7 @@ class Pytris:
                             self.draw_mino()
                             self.draw_board()
 
-                pygame.display.update()
+                self.update_display()
 
             # Game over screen
             elif self.game_over:
@@ -381,13 +371,12 @@ class Pytris:
                             self.blink = True
 
                         pygame.display.update()
+                        self.invalidate_board()
                     elif event.type == KEYDOWN:
                         if event.key == K_RETURN:
                             self.ui_vars.click_sound.play()
 
-                            outfile = open(Path(Path(__file__).parent.absolute(),"leaderboard.txt"),'a')
-                            outfile.write(chr(self.name[0]) + chr(self.name[1]) + chr(self.name[2]) + ' ' + str(self.score) + '\n')
-                            outfile.close()
+                            self.save_score(chr(self.name[0]) + chr(self.name[1]) + chr(self.name[2]), self.score)
 
                             self.default_values()
 
@@ -457,238 +446,190 @@ class Pytris:
                 self.screen.blit(leader_2, (10, 23))
                 self.screen.blit(leader_3, (10, 36))
 
+                self.invalidate_board()
                 if not self.start:
                     pygame.display.update()
                     self.clock.tick(3)
+        if self.ai:
+            self.move_worker.stop()
         pygame.quit()
 
+    def run_turbo(self, render_pieces=100, render_ms=250, max_pieces=None):
+        """
+        Spectates the agent at headless speed: pieces are placed without falling
+        and the screen is drawn every render_pieces pieces or render_ms
+        milliseconds, whichever comes first, with the pieces/sec rate since the
+        previous frame under the lines count. Plays until game over or max_pieces, then waits for the window to close
+        """
+        if self.ai is None:
+            return "Can't run turbo mode with no AI!"
 
-    # Draw block
-    def draw_block(self, x, y, color):
-        pygame.draw.rect(
-            self.screen,
-            color,
-            Rect(x, y, self.block_size, self.block_size)
-        )
-        pygame.draw.rect(
-            self.screen,
-            self.ui_vars.grey_1,
-            Rect(x, y, self.block_size, self.block_size),
-            1
-        )
-
-    # Draw game screen
-    def draw_board(self):
-        self.screen.fill(self.ui_vars.grey_1)
-
-        # Draw sidebar
-        pygame.draw.rect(
-            self.screen,
-            self.ui_vars.white,
-            Rect(204, 0, 96, 374)
-        )
+        pygame.init()
+        self.ui_vars = UI_variables()
+        self.build_surfaces()
+        self.screen = pygame.display.set_mode((300, 374))
+        pygame.display.set_caption("PYTRIS™")
 
-        # Draw next mino
-        grid_n = tetrimino.mino_map[self.next_mino - 1][0]
+        colors = ColorBoard()
+        self.board = Bitboard.from_matrix(self.matrix)
+        colors.rows = [[self.matrix[x][y] for x in range(WIDTH)] for y in range(HEIGHT)]
+        features = BoardFeatures(self.board)
+        last_render = time.perf_counter()
+        rendered_pieces = 0
+        rate = 0
+        while not self.done:
+            if features is not None:
+                features = self.place_headless(features, colors)
+                if features is None or self.pieces == max_pieces:
+                    features = None
+                    self.game_over = True
+                    self.print_stats()
+            now = time.perf_counter()
+            if self.game_over or self.pieces - rendered_pieces >= render_pieces or now - last_render >= render_ms / 1000:
+                self.matrix = colors.to_matrix()
+                self.draw_board()
+                # Measured since the last frame, an average since the start would hide slowdowns
+                if self.pieces > rendered_pieces and now > last_render:
+                    rate = (self.pieces - rendered_pieces) / (now - last_render)
+                self.draw_rate(rate)
+                self.update_display()
+                last_render, rendered_pieces = now, self.pieces
+                for event in pygame.event.get():
+                    if event.type == QUIT or (event.type == KEYDOWN and event.key == K_ESCAPE):
+                        self.done = True
+                if self.game_over and not self.done:
+                    pygame.time.wait(100)
+        pygame.quit()
+        return self.score
 
-        for i in range(4):
-            for j in range(4):
-                dx = 220 + self.block_size * j
-                dy = 140 + self.block_size * i
-                if grid_n[i][j] != 0:
-                    pygame.draw.rect(
-                        self.screen,
-                        self.ui_vars.t_color[grid_n[i][j]],
-                        Rect(dx, dy, self.block_size, self.block_size)
-                    )
-
-        # Draw hold mino
-
-        if self.hold_mino is not None:
-            grid_h = tetrimino.mino_map[self.hold_mino - 1][0]
-            for i in range(4):
-                for j in range(4):
-                    dx = 220 + self.block_size * j
-                    dy = 50 + self.block_size * i
-                    if grid_h[i][j] != 0:
-                        pygame.draw.rect(
-                            self.screen,
-                            self.ui_vars.t_color[grid_h[i][j]],
-                            Rect(dx, dy, self.block_size, self.block_size)
-                        )
-
-        # Draw texts
-        text_hold = self.ui_vars.h5.render("HOLD", 1, self.ui_vars.black)
-        text_next = self.ui_vars.h5.render("NEXT", 1, self.ui_vars.black)
-        text_score = self.ui_vars.h5.render("SCORE", 1, self.ui_vars.black)
-        score_value = self.ui_vars.h4.render(str(self.score), 1, self.ui_vars.black)
-        text_level = self.ui_vars.h5.render("LEVEL", 1, self.ui_vars.black)
-        level_value = self.ui_vars.h4.render(str(self.level), 1, self.ui_vars.black)
-        text_lines = self.ui_vars.h5.render("LINES", 1, self.ui_vars.black)
-        lines_value = self.ui_vars.h4.render(str(self.lines), 1, self.ui_vars.black)
-
-        # Place texts
-        self.screen.blit(text_hold, (215, 14))
-        self.screen.blit(text_next, (215, 104))
-        self.screen.blit(text_score, (215, 194))
-        self.screen.blit(score_value, (220, 210))
-        self.screen.blit(text_level, (215, 254))
-        self.screen.blit(level_value, (220, 270))
-        self.screen.blit(text_lines, (215, 314))
-        self.screen.blit(lines_value, (220, 330))
-
-        # Draw board
-        for x in range(self.width):
-            for y in range(self.height):
-                dx = 17 + self.block_size * x
-                dy = 17 + self.block_size * y
-                self.draw_block(dx, dy, self.ui_vars.t_color[self.matrix[x][y + 1]])
-
-    # Draw a tetrimino
-    def draw_mino(self):
-        grid = tetrimino.mino_map[self.mino - 1][self.rotation]
-        tx, ty = self.dx, self.dy
-        while not self.is_bottom(tx, ty):
-            ty += 1
-
-        if not self.ai:
-            # Draw ghost
+    # Draws the turbo mode pieces/sec readout at the bottom of the sidebar
+    def draw_rate(self, pieces_per_sec):
+        area = Rect(204, 358, 96, 16)
+        self.screen.fill(self.ui_vars.white, area)
+        text = self.ui_vars.h6.render(f"{pieces_per_sec:,.0f} PIECES/S", 1, self.ui_vars.black)
+        self.screen.blit(text, (215, 358))
+        self.dirty_rects.append(area)
+
+    # Picks up the move of the spawned piece and starts searching the move of the next one
+    def next_ai_move(self):
+        # Lines are cleared later in the tick, search on the board as it will be
+        board, _ = Bitboard.from_matrix(self.matrix).cleared()
+        lookahead = self.pieces_generator.peek()[0]
+        rotation, dx, dy = self.move_worker.take(board, self.mino, self.next_mino)
+        if rotation is None:    # No place left, the piece falls where it spawned
+            return
+        self.rotation, self.dx = rotation, dx
+        board, _ = board.placed(self.mino, rotation, dx, dy).cleared()
+        self.move_worker.submit(board, self.next_mino, lookahead)
+
+    # Pre-renders block tiles and static texts used by draw_board
+    def build_surfaces(self):
+        self.tiles = []         # Board blocks by matrix value
+        self.plain_tiles = []   # Borderless blocks of the sidebar previews
+        for color in self.ui_vars.t_color:
+            plain = pygame.Surface((self.block_size, self.block_size))
+            plain.fill(color)
+            tile = plain.copy()
+            pygame.draw.rect(tile, self.ui_vars.grey_1, Rect(0, 0, self.block_size, self.block_size), 1)
+            self.tiles.append(tile)
+            self.plain_tiles.append(plain)
+        self.labels = [
+            (self.ui_vars.h5.render("HOLD", 1, self.ui_vars.black), (215, 14)),
+            (self.ui_vars.h5.render("NEXT", 1, self.ui_vars.black), (215, 104)),
+            (self.ui_vars.h5.render("SCORE", 1, self.ui_vars.black), (215, 194)),
+            (self.ui_vars.h5.render("LEVEL", 1, self.ui_vars.black), (215, 254)),
+            (self.ui_vars.h5.render("LINES", 1, self.ui_vars.black), (215, 314)),
+        ]
+
+    # Makes the next draw_board repaint everything, for when something was drawn over the board
+    def invalidate_board(self):
+        self.rendered = None
+        self.dirty_rects = []
+
+    # Pushes the areas changed by draw_board to the display
+    def update_display(self):
+        if self.dirty_rects:
+            pygame.display.update(self.dirty_rects)
+            self.dirty_rects = []
+
+    # Draws a mino preview of the sidebar, top left corner at (220, y)
+    def draw_preview(self, mino, y):
+        if mino is not None:
+            grid = tetrimino.mino_map[mino - 1][0]
             for i in range(4):
                 for j in range(4):
                     if grid[i][j] != 0:
-                        self.matrix[tx + j][ty + i] = 8
-
-        # Draw mino
-        for i in range(4):
-            for j in range(4):
-                if grid[i][j] != 0:
-                    self.matrix[self.dx + j][self.dy + i] = grid[i][j]
-
-    # Erase a tetrimino
-    def erase_mino(self):
-        grid = tetrimino.mino_map[self.mino - 1][self.rotation]
-
-        if not self.ai:
-            # Erase ghost
-            for j in range(21):
-                for i in range(10):
-                    if self.matrix[i][j] == 8:
-                        self.matrix[i][j] = 0
-
-        # Erase mino
-        for i in range(4):
-            for j in range(4):
-                if grid[i][j] != 0:
-                    self.matrix[self.dx + j][self.dy + i] = 0
-
-    # Returns true if mino is at bottom
-    def is_bottom(self, x, y):
-        grid = tetrimino.mino_map[self.mino - 1][self.rotation]
-
-        for i in range(4):
-            for j in range(4):
-                if grid[i][j] != 0:
-                    if (y + i + 1) == 21:
-                        return True
-                    elif self.matrix[x + j][y + i + 1] != 0\
-                        and self.matrix[x + j][y + i + 1] != 8:
-                        return True
-        return False
-
-    # Returns true if new block is drawable
-    def is_stackable(self):
-        grid = tetrimino.mino_map[self.next_mino - 1][self.rotation]
-        for i in range(4):
-            for j in range(4):
-                if (self.dx + j) < 0 or (self.dx + j) > 9:
-                    continue
-                if grid[i][j] != 0 and self.matrix[self.dx + j][self.dy + i] != 0:
-                    return False
-        return True
-
-    # Returns true if mino is at the left edge
-    def is_leftedge(self):
-        grid = tetrimino.mino_map[self.mino - 1][self.rotation]
-
-        for i in range(4):
-            for j in range(4):
-                if grid[i][j] != 0:
-                    if (self.dx + j - 1) < 0:
-                        continue
-                    elif self.matrix[self.dx + j - 1][self.dy + i] != 0:
-                        return True
-
-        return False
-
-    # Returns true if mino is at the right edge
-    def is_rightedge(self):
-        grid = tetrimino.mino_map[self.mino - 1][self.rotation]
-
-        for i in range(4):
-            for j in range(4):
-                if grid[i][j] != 0:
-                    if (self.dx + j + 1) > 9:
-                        continue
-                    elif self.matrix[self.dx + j + 1][self.dy + i] != 0:
-                        return True
-
-        return False
-
-    # Returns true if turning right is possible
-    def is_turnable_r(self, x, y):
-        if self.rotation != 3:
-            grid = tetrimino.mino_map[self.mino - 1][self.rotation + 1]
-        else:
-            grid = tetrimino.mino_map[self.mino - 1][0]
-
-        for i in range(4):
-            for j in range(4):
-                if grid[i][j] != 0:
-                    if (x + j) < 0 or (x + j) > 9 or (y + i) < 0 or (y + i) > 20:
-                        continue
-                    elif self.matrix[x + j][y + i] != 0:
-                        return False
-        return True
-
-    # Returns true if turning left is possible
-    def is_turnable_l(self, x, y):
-        if self.rotation != 3:
-            grid = tetrimino.mino_map[self.mino - 1][self.rotation + 1]
-        else:
-            grid = tetrimino.mino_map[self.mino - 1][0]
+                        self.screen.blit(self.plain_tiles[grid[i][j]],
+                                         (220 + self.block_size * j, y + self.block_size * i))
+
+    # Repaints the part of the sidebar inside area, labels overlap the previews so everything is redrawn in order
+    def draw_sidebar(self, area):
+        self.screen.set_clip(area)
+        self.screen.fill(self.ui_vars.white, area)
+        self.draw_preview(self.next_mino, 140)
+        self.draw_preview(self.hold_mino, 50)
+        for text, position in self.labels:
+            self.screen.blit(text, position)
+        for name in ['score', 'level', 'lines']:
+            _, text, position = self.rendered[name]
+            self.screen.blit(text, position)
+        self.screen.set_clip(None)
+        self.dirty_rects.append(area)
+
+    # Draw game screen, only the parts that changed since the last call
+    def draw_board(self):
+        full = self.rendered is None
+        if full:
+            self.screen.fill(self.ui_vars.grey_1)
+            self.rendered = {'cells': [[None] * self.height for _ in range(self.width)],
+                             'next': None, 'hold': None}
+            self.dirty_rects.append(self.screen.get_rect())
+
+        # Find the sidebar areas that changed, values are rendered again only when they change
+        changed = []
+        for name, y in [('next', 140), ('hold', 50)]:
+            mino = getattr(self, name + '_mino')
+            if self.rendered[name] != mino:
+                self.rendered[name] = mino
+                changed.append(Rect(220, y, self.block_size * 4, self.block_size * 4))
+        for name, position in [('score', (220, 210)), ('level', (220, 270)), ('lines', (220, 330))]:
+            value = getattr(self, name)
+            last = self.rendered.get(name)
+            if last is None or last[0] != value:
+                text = self.ui_vars.h4.render(str(value), 1, self.ui_vars.black)
+                self.rendered[name] = (value, text, position)
+                area = text.get_rect(topleft=position)
+                changed.append(area if last is None else area.union(last[1].get_rect(topleft=position)))
 
-        for i in range(4):
-            for j in range(4):
-                if grid[i][j] != 0:
-                    if (x + j) < 0 or (x + j) > 9 or (y + i) < 0 or (y + i) > 20:
-                        continue
-                    elif self.matrix[x + j][y + i] != 0:
-                        return False
-        return True
-
-    # Returns 1 of the minos from the bag and ensures that each element will be spawned 
-    def get_mino_from_bag(self):
-        if self.bag == []:
-            self.bag = [1, 2, 3, 4, 5, 6, 7]
-        i = random.randrange(len(self.bag))      # get random index
-        self.bag[i], self.bag[-1] = self.bag[-1], self.bag[i]   # swap with the last element
-        return self.bag.pop()                    # pop last element O(1)
-
-    def print_stats(self):
-        print(f"{'='*20}")
-        print("{:^20s}".format("Game stats"))
-        print(f"{'-'*20}")
-        print(f"Score: {self.score}")
-        print(f"Lines: {self.lines}")
-        print(f"{'='*20}")
+        # Draw sidebar
+        if full:
+            self.draw_sidebar(Rect(204, 0, 96, 374))
+        elif changed:
+            self.draw_sidebar(changed[0].unionall(changed[1:]))
+
+        # Draw board cells that changed, with the ghost over empty cells
+        cells = self.rendered['cells']
+        ghost = dict.fromkeys(self.ghost, 8)
+        for x in range(self.width):
+            column = self.matrix[x]
+            drawn = cells[x]
+            for y in range(self.height):
+                value = column[y + 1] or ghost.get((x, y + 1), 0)
+                if drawn[y] != value:
+                    drawn[y] = value
+                    position = (17 + self.block_size * x, 17 + self.block_size * y)
+                    self.screen.blit(self.tiles[value], position)
+                    self.dirty_rects.append(Rect(position, (self.block_size, self.block_size)))
 
 
 if __name__ == "__main__":
     AI_RUN = True
-    #########           aggregated_height       n_holes             n_cols_with_holes       bumpiness               n_pits              deepest_well        row_transitions     col_transitions     lines_cleared
-    top_gene_weights = [-0.0279403731905886, -0.49807861137057663, -0.003623541808306773, -0.35611209635594987, -2.261251957450068, -0.30014145220851784, 0.0726731091781297, -7.944738378738265, 0.10771263721098738]
+    TURBO = False   # Watch the AI at headless speed
     if AI_RUN:
-        game = Pytris(ai=Genetic_AI(genotype=np.array(top_gene_weights)))
+        game = Pytris(ai=Genetic_AI(genotype=np.array(TOP_GENE_WEIGHTS)))
     else:
         game = Pytris()
-    game.run()
\ No newline at end of file
+    if AI_RUN and TURBO:
+        game.run_turbo()
+    else:
+        game.run()
\ No newline at end of file
@@ -0,0 +1,287 @@
+import random
+
+from genetic_ai import Genetic_AI
+from mino import *
+from bitboard import Bitboard
+from board_features import BoardFeatures
+
+
+class PieceGenerator:
+    """
+    7-bag piece stream. A seeded generator yields the same pieces for the same
+    seed, an unseeded one draws from the global random module.
+    Pieces of a pre-generated sequence are played first when one is given
+    """
+    def __init__(self, seed=None, sequence=()):
+        self.random = random if seed is None else random.Random(seed)
+        self.sequence = list(sequence)
+        self.bag = [1, 2, 3, 4, 5, 6, 7]
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.sequence:
+            return self.sequence.pop(0)
+        return self.draw()
+
+    # Draws a piece from the bag, refilling it when empty
+    def draw(self):
+        if self.bag == []:
+            self.bag = [1, 2, 3, 4, 5, 6, 7]
+        i = self.random.randrange(len(self.bag)) # get random index
+        self.bag[i], self.bag[-1] = self.bag[-1], self.bag[i]   # swap with the last element
+        return self.bag.pop()                    # pop last element O(1)
+
+    def take(self, length):
+        """
+        Returns the next length pieces as a list
+        """
+        return [next(self) for _ in range(length)]
+
+    def peek(self, length=1):
+        """
+        Returns the next length pieces without drawing them
+        """
+        while len(self.sequence) < length:
+            self.sequence.append(self.draw())
+        return self.sequence[:length]
+
+
+class PytrisCore:
+    """
+    Game state and rules of Pytris without any pygame dependency,
+    used directly for headless simulation
+    """
+    width = 10      # Board width
+    height = 20     # Board height
+
+    def default_values(self):
+        self.score_multiplier = [0, 50, 150, 350, 1000]
+        self.score = 0      # Total score during one game
+        self.level = 1      # Current level
+        self.goal = 10      # Lines per level
+        self.lines = 0      # Total lines done during one game
+        self.pieces = 0     # Pieces placed during one game
+        self.bottom_count = 0   # Counter for block to stay in place
+        self.hard_drop = False
+        
+        self.fall_time = 100  # Bigger -> Slower
+
+        # Initial values
+        self.blink = False      # Used for blinking effect
+        self.start = False      # True when game is being played
+        self.pause = False      # True when game is paused
+        self.done = False       # True when user quits game
+        self.game_over = False  # True when game over
+        
+        self.dx, self.dy = 3, 0     # Minos location status
+        self.rotation = 0           # Minos rotation status
+        self.mino = self.get_mino_from_bag()        # Current mino
+        self.next_mino = self.get_mino_from_bag()   # Next mino
+        
+        self.hold = False        # Hold status
+        self.hold_mino = None    # Holded mino
+
+        self.ai: Genetic_AI = None  # Agent playing (None = human player)
+
+        self.matrix = [[0 for y in range(self.height + 1)] for x in range(self.width)] # Board matrix
+
+        self.ghost = []         # Cells of the ghost piece while the mino is drawn, see ghost_cells
+        self.ghost_key = None   # Mino, rotation and x the ghost drop was searched for, None = search again
+        self.ghost_drop = []
+
+    def __init__(self, ai:Genetic_AI=None, seed=None, pieces=None):
+        self.ai = None
+        self.reset(ai=ai, seed=seed, pieces=pieces)
+
+    def reset(self, ai:Genetic_AI=None, seed=None, pieces=None):
+        """
+        Starts a new game on this instance, keeping the current agent unless one is given.
+        Lets one instance play many headless games without being rebuilt.
+        pieces is a PieceGenerator to draw from, by default a new one with the given seed
+        """
+        ai = ai or self.ai
+        # Pieces come from the global random module unless the game is seeded
+        self.pieces_generator = PieceGenerator(seed) if pieces is None else pieces
+        self.default_values()
+        if ai:
+            self.ai = ai
+            self.start = True
+
+    def run_headless(self, recorder=None):
+        """
+        Lets the agent play until game over or 500 pieces, returning the score.
+        Every placement goes to the recorder when one is given, see replay.ReplayRecorder
+        """
+        if self.ai is None:
+            return "Can't run instance with no AI!"
+        self.board = Bitboard.from_matrix(self.matrix)
+        features = BoardFeatures(self.board)
+        if recorder is not None:
+            recorder.start_game()
+        for pieces_dropped in range(500):    # Do N pieces maximum
+            features = self.place_headless(features, recorder)
+            if features is None:
+                break
+        self.matrix = self.board.to_matrix()
+        return self.score
+
+    # Returns the (x, y) cells where the falling mino would land. The drop is only
+    # searched again after the mino moved sideways or turned, or ghost_key was reset
+    # because the board changed
+    def ghost_cells(self):
+        key = (self.mino, self.rotation, self.dx)
+        if self.ghost_key != key:
+            grid = tetrimino.mino_map[self.mino - 1][self.rotation]
+            tx, ty = self.dx, self.dy
+            while not self.is_bottom(tx, ty):
+                ty += 1
+            self.ghost_key = key
+            self.ghost_drop = [(tx + j, ty + i) for i in range(4) for j in range(4) if grid[i][j] != 0]
+        return self.ghost_drop
+
+    def place_headless(self, features: BoardFeatures, recorder=None):
+        """
+        Places the current mino where the agent wants it and spawns the next one.
+        Returns the features of the new board, or None when the game is over
+        """
+        self.rotation, self.dx, self.dy = self.ai.get_best_placement(self.board, self.mino, features, self.next_mino)
+        if self.rotation is None:   # No place left for the piece
+            return None
+        features, erase_count = features.placed(self.mino, self.rotation, self.dx, self.dy).cleared()
+        if recorder is not None:
+            recorder.record(self.mino, self.rotation, self.dx, self.dy, erase_count, self.board)
+        self.board = features.board
+        self.score += self.score_multiplier[erase_count] * self.level
+        self.lines += erase_count
+        self.pieces += 1
+        self.mino, self.next_mino = self.next_mino, self.get_mino_from_bag()
+        self.dx, self.dy = 3, 0
+        self.rotation = 0
+        if self.board.collides(self.next_mino, self.rotation, self.dx, self.dy):
+            return None
+        return features
+
+    # Draw a tetrimino
+    def draw_mino(self):
+        grid = tetrimino.mino_map[self.mino - 1][self.rotation]
+
+        if not self.ai:
+            # Show ghost, it's drawn over empty cells at render time
+            self.ghost = self.ghost_cells()
+
+        # Draw mino
+        for i in range(4):
+            for j in range(4):
+                if grid[i][j] != 0:
+                    self.matrix[self.dx + j][self.dy + i] = grid[i][j]
+
+    # Erase a tetrimino
+    def erase_mino(self):
+        grid = tetrimino.mino_map[self.mino - 1][self.rotation]
+
+        # Hide ghost
+        self.ghost = []
+
+        # Erase mino
+        for i in range(4):
+            for j in range(4):
+                if grid[i][j] != 0:
+                    self.matrix[self.dx + j][self.dy + i] = 0
+
+    # Returns true if mino is at bottom
+    def is_bottom(self, x, y):
+        grid = tetrimino.mino_map[self.mino - 1][self.rotation]
+
+        for i in range(4):
+            for j in range(4):
+                if grid[i][j] != 0:
+                    if (y + i + 1) == 21:
+                        return True
+                    elif self.matrix[x + j][y + i + 1] != 0:
+                        return True
+        return False
+
+    # Returns true if new block is drawable
+    def is_stackable(self):
+        grid = tetrimino.mino_map[self.next_mino - 1][self.rotation]
+        for i in range(4):
+            for j in range(4):
+                if (self.dx + j) < 0 or (self.dx + j) > 9:
+                    continue
+                if grid[i][j] != 0 and self.matrix[self.dx + j][self.dy + i] != 0:
+                    return False
+        return True
+
+    # Returns true if mino is at the left edge
+    def is_leftedge(self):
+        grid = tetrimino.mino_map[self.mino - 1][self.rotation]
+
+        for i in range(4):
+            for j in range(4):
+                if grid[i][j] != 0:
+                    if (self.dx + j - 1) < 0:
+                        continue
+                    elif self.matrix[self.dx + j - 1][self.dy + i] != 0:
+                        return True
+
+        return False
+
+    # Returns true if mino is at the right edge
+    def is_rightedge(self):
+        grid = tetrimino.mino_map[self.mino - 1][self.rotation]
+
+        for i in range(4):
+            for j in range(4):
+                if grid[i][j] != 0:
+                    if (self.dx + j + 1) > 9:
+                        continue
+                    elif self.matrix[self.dx + j + 1][self.dy + i] != 0:
+                        return True
+
+        return False
+
+    # Returns true if turning right is possible
+    def is_turnable_r(self, x, y):
+        if self.rotation != 3:
+            grid = tetrimino.mino_map[self.mino - 1][self.rotation + 1]
+        else:
+            grid = tetrimino.mino_map[self.mino - 1][0]
+
+        for i in range(4):
+            for j in range(4):
+                if grid[i][j] != 0:
+                    if (x + j) < 0 or (x + j) > 9 or (y + i) < 0 or (y + i) > 20:
+                        continue
+                    elif self.matrix[x + j][y + i] != 0:
+                        return False
+        return True
+
+    # Returns true if turning left is possible
+    def is_turnable_l(self, x, y):
+        if self.rotation != 3:
+            grid = tetrimino.mino_map[self.mino - 1][self.rotation + 1]
+        else:
+            grid = tetrimino.mino_map[self.mino - 1][0]
+
+        for i in range(4):
+            for j in range(4):
+                if grid[i][j] != 0:
+                    if (x + j) < 0 or (x + j) > 9 or (y + i) < 0 or (y + i) > 20:
+                        continue
+                    elif self.matrix[x + j][y + i] != 0:
+                        return False
+        return True
+
+    # Returns 1 of the minos from the bag and ensures that each element will be spawned 
+    def get_mino_from_bag(self):
+        return next(self.pieces_generator)
+
+    def print_stats(self):
+        print(f"{'='*20}")
+        print("{:^20s}".format("Game stats"))
+        print(f"{'-'*20}")
+        print(f"Score: {self.score}")
+        print(f"Lines: {self.lines}")
+        print(f"{'='*20}")
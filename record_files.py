@@ -0,0 +1,33 @@
+import json
+from pathlib import Path
+import numpy as np
+
+
+# Binary record files are flat arrays of fixed size numpy records, described by
+# a JSON header next to them, see training_log.TrainingLog and replay.ReplayRecorder
+
+
+def header_path(path):
+    return Path(f"{path}.json")
+
+
+def write_header(path, dtype: np.dtype, **fields):
+    """
+    Writes the JSON header of the record file at path, the record layout and any other fields
+    """
+    with open(header_path(path), 'w') as f:
+        json.dump({**fields, 'dtype': dtype.descr}, f)
+
+
+def load_records(path):
+    """
+    Memory maps a record file as a structured array with a record per complete record written
+    """
+    with open(header_path(path)) as f:
+        header = json.load(f)
+    # JSON turns the shapes of array fields into lists
+    dtype = np.dtype([tuple(field[:2]) + tuple(tuple(shape) for shape in field[2:]) for field in header['dtype']])
+    size = Path(path).stat().st_size
+    if size < dtype.itemsize:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=size // dtype.itemsize)
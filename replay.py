@@ -0,0 +1,111 @@
+from pathlib import Path
+import numpy as np
+
+from bitboard import Bitboard, WIDTH, HEIGHT
+from record_files import write_header, load_records
+
+BOARD_BYTES = (WIDTH * HEIGHT + 7) // 8     # 210 bits of a board packed into 27 bytes
+
+
+def pack_board(board: Bitboard):
+    """
+    Packs the HEIGHT rows of WIDTH bits of a board into BOARD_BYTES bytes, top row first
+    """
+    value = 0
+    for y, row in enumerate(board.rows):
+        value |= row << (WIDTH * y)
+    return value.to_bytes(BOARD_BYTES, 'little')
+
+
+def unpack_board(data):
+    """
+    Rebuilds the board packed by pack_board
+    """
+    value = int.from_bytes(bytes(data), 'little')
+    mask = (1 << WIDTH) - 1
+    return Bitboard([(value >> (WIDTH * y)) & mask for y in range(HEIGHT)])
+
+
+def record_dtype(boards=False):
+    """
+    Layout of one placement: game number, piece, rotation, x and y of the drop,
+    lines it cleared and optionally the packed board the piece was dropped on
+    """
+    fields = [('game', '<u4'), ('piece', 'u1'), ('rotation', 'u1'), ('x', 'i1'), ('y', 'u1'), ('lines_cleared', 'u1')]
+    if boards:
+        fields.append(('board', 'u1', (BOARD_BYTES,)))
+    return np.dtype(fields)
+
+
+class ReplayRecorder:
+    """
+    Records the placements of headless games into a flat file of fixed size
+    records, one per placement, that load_replay memory maps. Pass it to
+    PytrisCore.run_headless, every game played with it gets the next game number.
+    With boards the board every piece was dropped on is stored too, 27 bytes each
+    """
+    def __init__(self, path, boards=False, buffer_size=4096):
+        self.path = Path(path)
+        self.dtype = record_dtype(boards)
+        self.boards = boards
+        self.buffer = np.zeros(buffer_size, dtype=self.dtype)
+        self.buffered = 0
+        self.game = -1
+        write_header(self.path, self.dtype, boards=boards)
+        self.file = open(self.path, 'wb')
+
+    def start_game(self):
+        self.game += 1
+
+    # Buffers the drop of mino at (rotation, x, y) on board
+    def record(self, mino, rotation, x, y, lines_cleared, board: Bitboard = None):
+        record = self.buffer[self.buffered]
+        record['game'] = self.game
+        record['piece'] = mino
+        record['rotation'] = rotation
+        record['x'] = x
+        record['y'] = y
+        record['lines_cleared'] = lines_cleared
+        if self.boards:
+            record['board'] = np.frombuffer(pack_board(board), dtype=np.uint8)
+        self.buffered += 1
+        if self.buffered == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer[:self.buffered].tobytes())
+        self.file.flush()
+        self.buffered = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_replay(path):
+    """
+    Memory maps a replay file as a structured array with a record per placement
+    """
+    return load_records(path)
+
+
+def replay_game(records):
+    """
+    Replays the placements of one game, yielding (board before the drop, record)
+    and checking the recorded line clears and boards along the way
+    """
+    board = Bitboard()
+    for record in records:
+        if 'board' in records.dtype.names and unpack_board(record['board']) != board:
+            raise ValueError(f"Board before placement {record} doesn't match the replay")
+        yield board, record
+        board, erase_count = board.placed(int(record['piece']), int(record['rotation']),
+                                          int(record['x']), int(record['y'])).cleared()
+        if erase_count != record['lines_cleared']:
+            raise ValueError(f"Placement {record} cleared {erase_count} lines in the replay")
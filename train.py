@@ -2,43 +2,313 @@ import random
 import numpy as np
 import time
 import csv
+import json
+import os
+from collections import namedtuple
+from multiprocessing import Pool
+from pathlib import Path
 from tqdm import tqdm
 
-from genetic_ai import Genetic_AI
-from pytris import Pytris
+import instrumentation
+from genetic_ai import Genetic_AI, NUM_FEATURES, MUTATION
+from board_features import get_shared_cache
+from batch_sim import BatchSimulator
+from pytris_core import PytrisCore
+from training_log import TrainingLog
 
-def cross(a1, a2):
+# Headless game reused by every play_game call of a process
+headless_game = None
+
+# Standard errors below the survival boundary at which racing agents stop playing
+RACING_Z = 2.0
+# Score standard deviation over mean assumed before any agent played twice, the low end of the
+# 0.7 to 1 evolved agents show, so agents that score next to nothing in their first game stop
+SCORE_CV = 0.7
+
+# Outcome of one fitness game, seconds and timings are only measured when profiling
+GameResult = namedtuple('GameResult', ['score', 'pieces', 'seconds', 'timings'])
+
+
+def play_game(genotype, seed=None, beam_width=0, cache_size=0):
+    """
+    Plays one headless game with the given genotype and piece seed, returning the score.
+    With a cache_size board ratings are cached in a table shared by all games of the process
+    """
+    cache = get_shared_cache(cache_size) if cache_size else None
+    ai = Genetic_AI(genotype=genotype, beam_width=beam_width, cache=cache)
+    global headless_game
+    if headless_game is None:
+        headless_game = PytrisCore(ai=ai, seed=seed)
+    else:
+        headless_game.reset(ai=ai, seed=seed)
+    return headless_game.run_headless()
+
+
+def play_game_task(task):
+    score = play_game(*task)
+    return GameResult(score, headless_game.pieces, 0.0, None)
+
+
+def profile_game_task(task):
+    """
+    Plays a game like play_game_task, also timing the game and its hot paths
+    """
+    start = time.perf_counter()
+    score = play_game(*task)
+    return GameResult(score, headless_game.pieces, time.perf_counter() - start, instrumentation.collect())
+
+
+def play_batch_task(task, profile=False):
+    """
+    Plays a batch of games in lockstep, returning a GameResult per game.
+    Games of a batch run together, so with profile the batch time is split evenly between them
     """
-    Compute crossover of two agents, returning a new agent
+    genotypes, seeds = task
+    start = time.perf_counter()
+    sim = BatchSimulator(genotypes, seeds)
+    sim.run()
+    seconds = (time.perf_counter() - start) / len(seeds) if profile else 0.0
+    return [GameResult(score, pieces, seconds, None)
+            for score, pieces in zip(sim.scores.tolist(), sim.pieces_dropped.tolist())]
+
+
+def profile_batch_task(task):
+    return play_batch_task(task, profile=True)
+
+
+def play_games(tasks, pool=None, batch_size=0, profile=False, chunksize=1):
     """
-    new_genotype = []
-    a1_prop = a1.fit_rel / a2.fit_rel
-    for i in range(len(a1.genotype)):
-        rand = random.uniform(0, 1)
-        if rand > a1_prop:
-            new_genotype.append(a1.genotype[i])
-        else:
-            new_genotype.append(a2.genotype[i])
+    Plays (genotype, seed, beam_width, cache_size) tasks on the pool when one is
+    given, returning a GameResult per task. Game seconds and hot path timings are
+    only measured with profile
+    """
+    if batch_size:
+        batch_task = profile_batch_task if profile else play_batch_task
+        batches = [([task[0] for task in tasks[i:i + batch_size]], [task[1] for task in tasks[i:i + batch_size]])
+                   for i in range(0, len(tasks), batch_size)]
+        results = map(batch_task, batches) if pool is None else pool.imap(batch_task, batches)
+        return [game for batch in tqdm(results, total=len(batches), desc="Batches played", unit=" batches")
+                for game in batch]
+    game_task = profile_game_task if profile else play_game_task
+    if pool is None:
+        return [game_task(task) for task in tqdm(tasks, desc="Games played", unit=" games")]
+    return list(tqdm(pool.imap(game_task, tasks, chunksize=chunksize),
+                     total=len(tasks), desc="Games played", unit=" games"))
+
 
-    return Genetic_AI(genotype=np.array(new_genotype), mutate=True)
+def compute_population_fitness(population, num_trials, pool=None, beam_width=0, cache_size=0, batch_size=0,
+                               profile=False, common_pieces=False, racing=False, num_parents=None):
+    """
+    Computes fitness of every agent of a (pop_size, NUM_FEATURES) genotype
+    matrix, spreading agent x trial games over the pool
+    when one is given. Piece seeds are drawn here so the result depends only on
+    the state of the random module, not on the number of workers.
+    With common_pieces every agent plays the same num_trials piece sequences,
+    so fitness differences come from the agents rather than from the pieces.
+    With a batch_size games are simulated in lockstep batches of that many games.
+    With racing the games are spent by race_population_fitness instead.
+    Returns the fitness and the GameResults of every agent
+    """
+    if racing:
+        return race_population_fitness(population, num_trials, num_parents, pool, beam_width, cache_size,
+                                       batch_size, profile, common_pieces)
+    if common_pieces:
+        # A seed stands for its whole piece sequence, see pytris_core.PieceGenerator
+        seeds = [random.getrandbits(32) for _ in range(num_trials)]
+        tasks = [(genotype, seed, beam_width, cache_size) for genotype in population for seed in seeds]
+    else:
+        tasks = [(genotype, random.getrandbits(32), beam_width, cache_size)
+                 for genotype in population for _ in range(num_trials)]
+    results = play_games(tasks, pool, batch_size, profile, chunksize=num_trials)
+    games = [results[i:i + num_trials] for i in range(0, len(results), num_trials)]
+    fitness = np.array([[game.score for game in agent_games] for agent_games in games], dtype=float)
+    return np.average(fitness, axis=1), games
 
 
-def compute_fitness(agent, num_trials):
+def race_population_fitness(population, num_trials, num_parents, pool=None, beam_width=0, cache_size=0,
+                            batch_size=0, profile=False, common_pieces=False):
     """
-    Given an agent and a number of trials, computes fitness as
-    arithmetic mean of lines cleared over the trials
+    Spends the num_trials games per agent budget where they decide selection.
+    Agents play a game per round, after every round the agents whose mean score
+    is more than RACING_Z standard errors of the difference below the boundary
+    between the num_parents best agents and the rest can't make the cutoff and
+    stop playing. The boundary is the mean of the 2 agents on either side of it.
+    Every other agent plays num_trials games, so the elite and the parents are
+    rated as without racing. The games left over go to the agents still too
+    close to the boundary to tell, closest first, up to 2 * num_trials games each
     """
-    fitness = []
-    for _ in range(num_trials):
-        pytris = Pytris(ai=agent, headless=True)
-        score = pytris.run_headless()
-        fitness.append(score)
-    return np.average(np.array(fitness))
+    budget = len(population) * num_trials
+    games = [[] for _ in population]
+    seeds = []      # Shared piece seeds by trial with common_pieces
+    ranked = num_parents is not None and num_parents < len(population)
+    racing = list(range(len(population)))   # Agents that can still make the cutoff
+    distance = {}
+    while budget:
+        agents = [i for i in racing if len(games[i]) < num_trials]
+        if not agents and ranked:
+            agents = sorted((i for i in racing if len(games[i]) < 2 * num_trials and abs(distance[i]) < RACING_Z),
+                            key=lambda i: abs(distance[i]))
+        agents = agents[:budget]
+        if not agents:
+            break
+        tasks = []
+        for i in agents:
+            if common_pieces:
+                while len(seeds) <= len(games[i]):
+                    seeds.append(random.getrandbits(32))
+                seed = seeds[len(games[i])]
+            else:
+                seed = random.getrandbits(32)
+            tasks.append((population[i], seed, beam_width, cache_size))
+        for i, game in zip(agents, play_games(tasks, pool, batch_size, profile)):
+            games[i].append(game)
+        budget -= len(agents)
 
+        scores = [np.array([game.score for game in agent_games], dtype=float) for agent_games in games]
+        fitness = np.array([agent_scores.mean() for agent_scores in scores])
+        if ranked:
+            order = np.argsort(-fitness, kind='stable')
+            edge = order[num_parents - 1:num_parents + 1]   # The last parent and the first agent left out
+            boundary = fitness[edge].mean()
+            # Scores spread in proportion to their mean, with a coefficient of variation pooled over the
+            # agents with a few games
+            repeated = [agent_scores for agent_scores in scores if len(agent_scores) > 1 and agent_scores.mean() > 0]
+            if repeated:
+                cv = np.sqrt(sum((((agent_scores - agent_scores.mean()) / agent_scores.mean()) ** 2).sum()
+                                 for agent_scores in repeated) / sum(len(agent_scores) - 1 for agent_scores in repeated))
+            else:
+                cv = SCORE_CV
+            variance = (cv * fitness) ** 2 / np.array([len(agent_games) for agent_games in games])
+            # Standard error of the difference between an agent's mean and the boundary
+            errors = {i: np.sqrt(variance[i] + variance[edge].sum() / 4) or 1.0 for i in racing}
+            distance = {i: (fitness[i] - boundary) / errors[i] for i in racing}
+            racing = [i for i in racing if distance[i] > -RACING_Z]
+    return fitness, games
 
 
-def run(num_epochs=20, num_trials=3, pop_size=100, num_elite=5, survival_rate=.35, logging_file=f"run_at_{int(time.time())}.csv"):
+def run(num_epochs=20, num_trials=3, pop_size=100, num_elite=5, survival_rate=.35, logging_file=f"run_at_{int(time.time())}.csv",
+        num_workers=1, seed=None, beam_width=0, cache_size=0, batch_size=0, profile=False,
+        common_pieces=False, racing=False, checkpoint_file=None, checkpoint_every=1, structured_log=False):
+    """
+    Evolves a population of agents. With num_workers > 1 games are played on a
+    process pool, a fixed seed makes the run reproducible for any worker count.
+    beam_width > 0 makes agents look ahead at the next piece during fitness games,
+    cache_size > 0 shares a board ratings cache between the games of each process,
+    batch_size > 0 simulates games in lockstep batches of that many games.
+    common_pieces evaluates every agent on the same piece sequences each epoch,
+    racing stops the games of agents that clearly miss the survival cutoff
+    and spends the games saved on agents close to it.
+    profile times the hot paths and game lengths, writing them every epoch as
+    JSON lines to a .profile.jsonl file next to the logging file.
+    With a checkpoint_file the run is saved every checkpoint_every epochs, see resume.
+    structured_log also streams every epoch with the fitness of every agent to a
+    binary .trainlog file next to the logging file, see training_log.load_log
+    """
+    if batch_size and (beam_width or cache_size):
+        raise ValueError("Batched games don't support lookahead or the ratings cache")
+    game_options = {'beam_width': beam_width, 'cache_size': cache_size, 'batch_size': batch_size, 'profile': profile,
+                    'common_pieces': common_pieces, 'racing': racing,
+                    'num_parents': round(pop_size * survival_rate)}
+    settings = {'num_epochs': num_epochs, 'num_trials': num_trials, 'pop_size': pop_size, 'num_elite': num_elite,
+                'survival_rate': survival_rate, 'logging_file': str(logging_file), 'game_options': game_options,
+                'checkpoint_file': checkpoint_file, 'checkpoint_every': checkpoint_every,
+                'structured_log': structured_log}
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+    return evolve_with_workers(settings, num_workers)
+
+
+def resume(checkpoint_file, num_workers=1, num_epochs=None):
+    """
+    Continues the run saved in checkpoint_file, optionally changing its total
+    number of epochs. The log files are cut back to the checkpoint and the
+    run goes on exactly as if it had never stopped
+    """
+    state = load_checkpoint(checkpoint_file)
+    settings = state['settings']
+    settings['checkpoint_file'] = str(checkpoint_file)
+    if num_epochs is not None:
+        settings['num_epochs'] = num_epochs
+    return evolve_with_workers(settings, num_workers, state)
+
 
+def evolve_with_workers(settings, num_workers, state=None):
+    profile = settings['game_options']['profile']
+    if profile:
+        instrumentation.enable()
+        instrumentation.collect()
+    pool = Pool(num_workers, initializer=instrumentation.enable if profile else None) if num_workers > 1 else None
+    try:
+        return evolve(settings, pool, state)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if profile:
+            instrumentation.disable()
+
+
+def save_checkpoint(path, epoch, population, last_population, last_fitness, data, settings):
+    """
+    Saves everything needed to continue a run at epoch: the population about
+    to be evaluated, the states of both random generators, the last CSV row and
+    the run settings. last_population, the genotypes of the previous epoch, is
+    stored with last_fitness for inspection. The file is replaced atomically
+    """
+    _, random_state, gauss_next = random.getstate()
+    _, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f,
+                 epoch=epoch,
+                 genotypes=population,
+                 last_genotypes=last_population,
+                 last_fitness=np.asarray(last_fitness, dtype=float),
+                 random_state=np.array(random_state, dtype=np.uint64),
+                 random_gauss=np.array(np.nan if gauss_next is None else gauss_next),
+                 np_random_keys=keys,
+                 np_random_pos=pos,
+                 np_random_gauss=np.array([has_gauss, cached_gaussian]),
+                 data=json.dumps(data),
+                 settings=json.dumps(settings))
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    """
+    Reads a checkpoint written by save_checkpoint and restores both random generators,
+    returns a dict of the epoch, population, last CSV row and run settings
+    """
+    with np.load(path) as checkpoint:
+        gauss_next = float(checkpoint['random_gauss'])
+        random.setstate((3, tuple(int(value) for value in checkpoint['random_state']),
+                         None if np.isnan(gauss_next) else gauss_next))
+        has_gauss, cached_gaussian = checkpoint['np_random_gauss']
+        np.random.set_state(('MT19937', checkpoint['np_random_keys'], int(checkpoint['np_random_pos']),
+                             int(has_gauss), float(cached_gaussian)))
+        return {
+            'epoch': int(checkpoint['epoch']),
+            'population': checkpoint['genotypes'],
+            'data': json.loads(str(checkpoint['data'])),
+            'settings': json.loads(str(checkpoint['settings'])),
+        }
+
+
+def truncate_lines(path, num_lines):
+    """
+    Keeps the first num_lines lines of a text file, dropping what a run wrote after its checkpoint
+    """
+    with open(path, encoding='UTF8', newline='') as f:
+        lines = f.readlines()[:num_lines]
+    with open(path, 'w', encoding='UTF8', newline='') as f:
+        f.writelines(lines)
+
+
+def start_log(logging_file):
+    """
+    Creates the CSV log of a run, returning its initial row
+    """
     # data collection over epochs
     headers = ['avg_fit','avg_gene', 'top_fit', 'top_gene', 'elite_fit', 'elite_gene']
     data=[1, np.ones(9).tolist(), 1, np.ones(9).tolist(),  1, np.ones(9).tolist()]
@@ -46,77 +316,130 @@ def run(num_epochs=20, num_trials=3, pop_size=100, num_elite=5, survival_rate=.3
         writer = csv.writer(f)
         writer.writerow(headers)
         writer.writerow(data)
+    return data
+
+
+def log_epoch(logging_file, data):
+    with open(logging_file, 'a', encoding='UTF8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(data)
+
 
-    # create inital population
-    population = [Genetic_AI() for _ in range(pop_size)]
+def random_population(pop_size):
+    """
+    Genotypes of pop_size random agents as a (pop_size, NUM_FEATURES) matrix
+    """
+    return np.random.uniform(-1, 1, (pop_size, NUM_FEATURES))
 
-    for epoch in tqdm(range(num_epochs), desc="Epochs passed", unit="epochs"):
-        """
-        Fitness
-        """
 
-        # data collection within epochs
-        total_fitness = 0
-        top_agent = 0
-        gene_sum = np.zeros(9)
+def next_generation(population, fitness, num_elite, survival_rate):
+    """
+    Keeps the elite and breeds the rest of the next generation from the agents
+    surviving at survival_rate, returning the next generation and the CSV row of the epoch.
+    population is a (pop_size, NUM_FEATURES) genotype matrix and fitness a vector of its fitness.
+    Each gene of a child comes from its first parent when a uniform draw exceeds the fitness ratio
+    of its parents, from the second otherwise, and is then mutated
+    """
+    pop_size = len(population)
+    fitness = np.asarray(fitness, dtype=float)
+    total_fitness = fitness.sum()
 
-        for i, agent in tqdm(enumerate(population), desc="Agents computed", unit=" agents"):
-            # compute fitness, add to total
-            agent.fit_score = compute_fitness(agent, num_trials=num_trials)
-            total_fitness += agent.fit_score 
-            gene_sum+=agent.genotype
+    # sort population by descending fitness, ties keep their order
+    with instrumentation.section('selection'):
+        order = np.argsort(-fitness, kind='stable')
+        elite = order[:num_elite]
+        # select top agents as parents base on survival rate
+        parents = order[:round(pop_size * survival_rate)]
 
+    with instrumentation.section('crossover'):
+        num_children = pop_size - num_elite
+        # every child gets its own 2 distinct parents, the second is offset from the first by 1 to
+        # len(parents) - 1 places so all ordered pairs are equally likely without a children x parents matrix
+        first = np.random.randint(len(parents), size=num_children)
+        second = (first + np.random.randint(1, len(parents), size=num_children)) % len(parents)
+        a1, a2 = parents[first], parents[second]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            a1_prop = fitness[a1] / fitness[a2]     # ratio of fit_rel, the share of total fitness
+        rand = np.random.uniform(0, 1, (num_children, NUM_FEATURES))
+        children = np.where(rand > a1_prop[:, None], population[a1], population[a2])
+        children *= np.random.normal(1, MUTATION, (num_children, NUM_FEATURES))
 
-        # compute % of fitness accounted for by each agent
-        for agent in population:
-            agent.fit_rel = agent.fit_score / total_fitness
+    next_gen = np.concatenate([population[elite], children])
 
-        """
-        Selection
-        """
+    avg_fit = (total_fitness/pop_size)
+    avg_gene = population.mean(axis=0)
+    top_fit = fitness[order[0]]
+    top_gene = population[order[0]]
+    elite_fit = fitness[elite].mean()
+    elite_gene = population[elite].mean(axis=0)
 
-        next_gen = []
+    data = [avg_fit, avg_gene.tolist(), top_fit, top_gene.tolist(), elite_fit, elite_gene.tolist()]
+    return next_gen, data
 
-        # sort population by descending fitness
-        sorted_pop = sorted(population, reverse=True)
 
-        # elite selection: copy over genotypes from top preforming agents
-        elite_fit_score = 0
-        elite_genes = np.zeros(9)
-        top_agent=sorted_pop[0]
+def evolve(settings, pool=None, state=None):
+    """
+    Runs the epochs of a run with the settings built by run, which are also
+    stored in its checkpoints. state is a checkpoint to continue from
+    """
+    num_epochs, num_trials, pop_size = settings['num_epochs'], settings['num_trials'], settings['pop_size']
+    num_elite, survival_rate = settings['num_elite'], settings['survival_rate']
+    logging_file, game_options = settings['logging_file'], settings['game_options']
+    checkpoint_file, checkpoint_every = settings['checkpoint_file'], settings['checkpoint_every']
+
+    profile_file = Path(logging_file).with_suffix('.profile.jsonl') if game_options['profile'] else None
+    log = None
+    if settings['structured_log']:
+        log = TrainingLog(Path(logging_file).with_suffix('.trainlog'), pop_size, append=state is not None)
+    if state is not None:
+        # continue a checkpointed run, logs keep the header, the initial row and a row per epoch
+        start_epoch = state['epoch']
+        population = state['population']
+        data = state['data']
+        truncate_lines(logging_file, start_epoch + 2)
+        if profile_file is not None:
+            truncate_lines(profile_file, start_epoch)
+        if log is not None:
+            log.truncate(start_epoch)
+    else:
+        start_epoch = 0
 
-        for i in range(num_elite):
-            elite_fit_score +=sorted_pop[i].fit_score
-            elite_genes += sorted_pop[i].genotype
-            next_gen.append(Genetic_AI(genotype=sorted_pop[i].genotype, mutate=False))
+        data = start_log(logging_file)
 
-        # selection: select top agents as parents base on survival rate
-        num_parents = round(pop_size * survival_rate)
-        parents = sorted_pop[:num_parents]
+        if profile_file is not None:
+            open(profile_file, 'w').close()
 
-        # crossover: randomly select 2 parents and cross genotypes
-        for _ in range(pop_size-(num_elite)):
-            # randomly select parents, apply crossover, and add to the next generation
-            # the cross functions automatically applies mutation to the new agent
-            parents = random.sample(parents, 2)
-            next_gen.append(cross(parents[0], parents[1]))
+        # create inital population
+        population = random_population(pop_size)
 
+    try:
+        for epoch in tqdm(range(start_epoch, num_epochs), initial=start_epoch, total=num_epochs,
+                          desc="Epochs passed", unit="epochs"):
+            fitness, games = compute_population_fitness(population, num_trials, pool, **game_options)
+            pieces = sum(game.pieces for agent_games in games for game in agent_games)
+            next_gen, data = next_generation(population, fitness, num_elite, survival_rate)
+            log_epoch(logging_file, data)
+            if log is not None:
+                log.append(epoch, fitness, data)
 
-        avg_fit = (total_fitness/pop_size)
-        avg_gene = (gene_sum/pop_size)
-        top_fit = (top_agent.fit_score)
-        top_gene = (top_agent.genotype)
-        elite_fit = (elite_fit_score/num_elite)
-        elite_gene = (elite_genes/num_elite)
+            if profile_file is not None:
+                sections = instrumentation.collect()
+                for agent_games in games:
+                    for game in agent_games:
+                        instrumentation.merge(sections, game.timings or {})
+                instrumentation.write_epoch(profile_file, epoch, sections, games)
 
-        data = [avg_fit, avg_gene.tolist(), top_fit, top_gene.tolist(), elite_fit, elite_gene.tolist()]
-        with open(logging_file, 'a', encoding='UTF8', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(data)
+            print(f'{epoch=}\ttotal fitness={data[0]}\tbest agent={data[2]}\tpieces={pieces}')
 
-        print(f'{epoch=}\ttotal fitness={total_fitness/pop_size}\tbest agent={top_agent.fit_score}')
+            if checkpoint_file is not None and ((epoch + 1) % checkpoint_every == 0 or epoch + 1 == num_epochs):
+                if log is not None:
+                    log.flush()
+                save_checkpoint(checkpoint_file, epoch + 1, next_gen, population, fitness, data, settings)
 
-        population = next_gen
+            population = next_gen
+    finally:
+        if log is not None:
+            log.close()
 
     return data
 
@@ -0,0 +1,89 @@
+import time
+from pathlib import Path
+import numpy as np
+
+from genetic_ai import FEATURE_NAMES
+from record_files import write_header, load_records
+
+
+def record_dtype(pop_size):
+    """
+    Layout of one epoch record: epoch number, average, top and elite fitness,
+    one column per gene of the average, top and elite genotypes and the
+    fitness of every agent
+    """
+    fields = [('epoch', '<i8'), ('avg_fit', '<f8'), ('top_fit', '<f8'), ('elite_fit', '<f8')]
+    for group in ['avg', 'top', 'elite']:
+        fields += [(f'{group}_{name}', '<f8') for name in FEATURE_NAMES]
+    fields.append(('fitness', '<f8', (pop_size,)))
+    return np.dtype(fields)
+
+
+class TrainingLog:
+    """
+    Append-only binary log of a training run, one fixed size record per epoch.
+    Records are buffered and written every flush_every epochs or flush_seconds
+    seconds, whichever comes first. The record layout is kept in a JSON header
+    next to the log, so the file can be memory mapped with load_log while a
+    run is still appending to it
+    """
+    def __init__(self, path, pop_size, flush_every=10, flush_seconds=30.0, append=False):
+        self.path = Path(path)
+        self.dtype = record_dtype(pop_size)
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        self.buffer = np.zeros(flush_every, dtype=self.dtype)
+        self.buffered = 0
+        self.last_flush = time.monotonic()
+        if not append:
+            write_header(self.path, self.dtype, pop_size=pop_size, genes=FEATURE_NAMES)
+        self.file = open(self.path, 'ab' if append else 'wb')
+
+    def append(self, epoch, fitness, data):
+        """
+        Buffers the record of an epoch, data being the CSV row of train.next_generation
+        """
+        avg_fit, avg_gene, top_fit, top_gene, elite_fit, elite_gene = data
+        record = self.buffer[self.buffered]
+        record['epoch'] = epoch
+        record['avg_fit'], record['top_fit'], record['elite_fit'] = avg_fit, top_fit, elite_fit
+        for group, genes in [('avg', avg_gene), ('top', top_gene), ('elite', elite_gene)]:
+            for name, gene in zip(FEATURE_NAMES, genes):
+                record[f'{group}_{name}'] = gene
+        record['fitness'] = fitness
+        self.buffered += 1
+        if self.buffered == self.flush_every or time.monotonic() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered records to disk
+        """
+        self.file.write(self.buffer[:self.buffered].tobytes())
+        self.file.flush()
+        self.buffered = 0
+        self.last_flush = time.monotonic()
+
+    def truncate(self, num_records):
+        """
+        Drops every record after the first num_records, used when resuming from a checkpoint
+        """
+        self.flush()
+        self.file.truncate(min(num_records * self.dtype.itemsize, self.path.stat().st_size))
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_log(path):
+    """
+    Memory maps a training log as a structured array with a record per flushed epoch
+    """
+    return load_records(path)
@@ -0,0 +1,345 @@
+import argparse
+import os
+import shutil
+import subprocess
+from pathlib import Path
+import numpy as np
+
+# Exports run on machines with no display or sound card, SDL gets dummy drivers unless told otherwise
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+import pygame
+
+from genetic_ai import Genetic_AI, TOP_GENE_WEIGHTS
+from ui_variables import UI_variables
+from pytris import Pytris, ColorBoard
+from bitboard import Bitboard
+from board_features import BoardFeatures
+from replay import load_replay, replay_game
+
+SCREEN_SIZE = (300, 374)
+PALETTE_SIZE = 256
+LZW_CODE_SIZE = 8   # Bits of a palette index in the GIF image data
+TRANSPARENT = PALETTE_SIZE - 1  # Palette index of the pixels a GIF frame leaves as they were
+
+
+def build_palette(ui_vars: UI_variables):
+    """
+    The 256 colors frames are reduced to: the colors of the game screen, then
+    a ramp from black to white for the anti-aliased sidebar texts. The last
+    one repeats black and is only used as the transparent color
+    """
+    colors = [ui_vars.grey_1, ui_vars.white, ui_vars.black] + ui_vars.t_color
+    ramp = np.linspace(ui_vars.black, ui_vars.white, PALETTE_SIZE - 1 - len(colors)).round()
+    return np.concatenate([np.array(colors, dtype=float), ramp, [ui_vars.black]]).astype(np.uint8)
+
+
+class FrameBuffer:
+    """
+    Palette indices of the pixels of an offscreen game screen. Only the areas
+    draw_board reported as dirty are read back from the surface, so a frame
+    costs about as much as the blocks that changed
+    """
+    def __init__(self, surface: pygame.Surface, palette):
+        self.surface = surface
+        self.palette = palette
+        self.pixels = np.zeros((surface.get_height(), surface.get_width()), dtype=np.uint8)
+        self.indices = {}   # Palette index of every 0xRRGGBB color met so far
+
+    # Returns the palette indices of the colors, adding the unseen ones as their nearest palette color
+    def lookup(self, colors):
+        unique, inverse = np.unique(colors, return_inverse=True)
+        new = [color for color in unique.tolist() if color not in self.indices]
+        if new:
+            rgb = (np.array(new)[:, None] >> np.array([16, 8, 0])) & 0xFF
+            distances = ((rgb[:, None, :] - self.palette[None, :, :].astype(int)) ** 2).sum(axis=2)
+            self.indices.update(zip(new, distances.argmin(axis=1).tolist()))
+        table = np.array([self.indices[color] for color in unique.tolist()], dtype=np.uint8)
+        return table[inverse.reshape(colors.shape)]
+
+    def update(self, rects):
+        """
+        Reads the areas in rects back from the surface, returns the whole frame
+        """
+        bounds = self.surface.get_rect()
+        pixels = pygame.surfarray.pixels3d(self.surface)
+        for rect in rects:
+            rect = rect.clip(bounds)
+            if rect.width and rect.height:
+                area = pixels[rect.left:rect.right, rect.top:rect.bottom].astype(np.int32)
+                colors = (area[..., 0] << 16) | (area[..., 1] << 8) | area[..., 2]
+                self.pixels[rect.top:rect.bottom, rect.left:rect.right] = self.lookup(colors.T)
+        del pixels  # Unlocks the surface
+        return self.pixels
+
+
+class LzwEncoder:
+    """
+    GIF flavoured LZW compression of palette indices. Runs of one index, like
+    the transparent pixels around the blocks that changed in a frame, are
+    matched in one step through the codes of the runs seen so far instead of
+    an index at a time, which keeps the pure Python encoder fast
+    """
+    clear = 1 << LZW_CODE_SIZE
+    end = clear + 1
+
+    def __init__(self):
+        self.data = bytearray()
+        self.bits = 0       # Bits of the codes not written to data yet
+        self.num_bits = 0
+        self.reset()
+
+    def reset(self):
+        self.table = {}     # Code of every (prefix code, index) string
+        self.runs = {}      # Codes of the strings of 2, 3, 4... times an index, by index
+        self.next_code = self.end + 1
+        self.width = LZW_CODE_SIZE + 1
+        self.decoder_next = None    # Next code of the decoder, which adds strings a code later than the encoder
+
+    # Writes a code, widening the codes when the decoder will
+    def emit(self, code):
+        self.bits |= code << self.num_bits
+        self.num_bits += self.width
+        while self.num_bits >= 8:
+            self.data.append(self.bits & 0xFF)
+            self.bits >>= 8
+            self.num_bits -= 8
+        if self.decoder_next is None:   # The first code after a clear adds no string
+            self.decoder_next = self.end + 1
+        else:
+            self.decoder_next += 1
+            if self.decoder_next == 1 << self.width and self.width < 12:
+                self.width += 1
+
+    # Adds the string of prefix followed by index, starting over when the table is full
+    def add(self, prefix, index):
+        if self.next_code == 4096:
+            self.emit(self.clear)
+            self.reset()
+            return
+        self.table[(prefix, index)] = self.next_code
+        run = self.runs.setdefault(index, [])
+        if prefix == (run[-1] if run else index):
+            run.append(self.next_code)
+        self.next_code += 1
+
+    def encode(self, indices):
+        """
+        Returns the GIF image data of the palette indices of an image
+        """
+        symbols = indices.ravel()
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(symbols)) + 1])
+        lengths = np.diff(np.append(starts, len(symbols)))
+        self.emit(self.clear)
+        self.reset()
+        prefix = None
+        for index, length in zip(symbols[starts].tolist(), lengths.tolist()):
+            while length:
+                if prefix is not None:
+                    code = self.table.get((prefix, index))
+                    if code is not None:
+                        prefix = code
+                        length -= 1
+                        continue
+                    self.emit(prefix)
+                    self.add(prefix, index)
+                prefix = index
+                length -= 1
+                # The string is a single index here, so the longest match is the longest known run
+                run = self.runs.get(index)
+                if run and length:
+                    step = min(len(run), length)
+                    prefix = run[step - 1]
+                    length -= step
+        if prefix is not None:
+            self.emit(prefix)
+        self.emit(self.end)
+        if self.num_bits:
+            self.data.append(self.bits)
+        data = bytes(self.data)
+        # Sub-blocks of at most 255 bytes, each after its length
+        blocks = [bytes([min(255, len(data) - i)]) + data[i:i + 255] for i in range(0, len(data), 255)]
+        return bytes([LZW_CODE_SIZE]) + b''.join(blocks) + b'\x00'
+
+
+class GifWriter:
+    """
+    Streams frames of palette indices into an animated GIF. Every frame only
+    stores the box around the pixels that changed since the one before it,
+    with the pixels that didn't change left transparent. Frames with no change
+    make the previous one last longer instead
+    """
+    def __init__(self, path, size, palette, fps=20, loop=0):
+        self.file = open(path, 'wb')
+        self.delay = max(2, round(100 / fps))     # Frame time in hundredths of a second
+        self.last = None
+        self.pending = None     # (area, pixels, delay) of the last frame, written once its delay is known
+        width, height = size
+        self.file.write(b'GIF89a' + width.to_bytes(2, 'little') + height.to_bytes(2, 'little') + b'\xf7\x00\x00')
+        self.file.write(palette.tobytes())
+        self.file.write(b'!\xff\x0bNETSCAPE2.0\x03\x01' + loop.to_bytes(2, 'little') + b'\x00')
+
+    def write(self, frame):
+        if self.last is None:
+            area = (0, 0, frame.shape[1], frame.shape[0])
+        else:
+            changed = frame != self.last
+            rows, columns = np.flatnonzero(changed.any(axis=1)), np.flatnonzero(changed.any(axis=0))
+            if not len(rows):
+                self.pending = self.pending[:2] + (self.pending[2] + self.delay,)
+                return
+            area = (columns[0], rows[0], columns[-1] + 1, rows[-1] + 1)
+        self.write_pending()
+        left, top, right, bottom = area
+        pixels = frame[top:bottom, left:right]
+        if self.last is not None:
+            pixels = np.where(changed[top:bottom, left:right], pixels, TRANSPARENT).astype(np.uint8)
+        self.pending = (area, pixels.copy(), self.delay)
+        self.last = frame.copy()
+
+    def write_pending(self):
+        if self.pending is None:
+            return
+        (left, top, right, bottom), pixels, delay = self.pending
+        # Graphic control extension, frames are drawn over the previous ones with a transparent color
+        self.file.write(b'!\xf9\x04\x05' + min(delay, 0xFFFF).to_bytes(2, 'little') + bytes([TRANSPARENT]) + b'\x00')
+        self.file.write(b',' + b''.join(int(value).to_bytes(2, 'little')
+                                         for value in (left, top, right - left, bottom - top)) + b'\x00')
+        self.file.write(LzwEncoder().encode(pixels))
+        self.pending = None
+
+    def close(self):
+        self.write_pending()
+        self.file.write(b';')
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FfmpegWriter:
+    """
+    Streams frames of palette indices to an ffmpeg process as raw RGB, for any
+    video format ffmpeg can write. Needs ffmpeg on the PATH
+    """
+    def __init__(self, path, size, palette, fps=20):
+        ffmpeg = shutil.which('ffmpeg')
+        if ffmpeg is None:
+            raise RuntimeError("Exporting videos needs ffmpeg on the PATH, export a .gif instead")
+        width, height = size
+        self.palette = palette
+        self.process = subprocess.Popen([ffmpeg, '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+                                         '-s', f'{width}x{height}', '-r', str(fps), '-i', '-',
+                                         '-pix_fmt', 'yuv420p', str(path)], stdin=subprocess.PIPE)
+
+    def write(self, frame):
+        self.process.stdin.write(self.palette[frame].tobytes())
+
+    def close(self):
+        self.process.stdin.close()
+        if self.process.wait():
+            raise RuntimeError(f"ffmpeg failed with exit code {self.process.returncode}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_writer(path, size, palette, fps=20):
+    """
+    GifWriter for .gif paths, FfmpegWriter for anything else
+    """
+    if Path(path).suffix.lower() == '.gif':
+        return GifWriter(path, size, palette, fps)
+    return FfmpegWriter(path, size, palette, fps)
+
+
+def offscreen_game(ai=None, seed=None):
+    """
+    Pytris drawing on a surface instead of a window, returned with the FrameBuffer reading it
+    """
+    pygame.init()
+    game = Pytris(ai=ai, seed=seed)
+    game.ui_vars = UI_variables()
+    game.build_surfaces()
+    game.screen = pygame.Surface(SCREEN_SIZE)
+    return game, FrameBuffer(game.screen, build_palette(game.ui_vars))
+
+
+# Draws the board of game and returns its frame
+def render(game: Pytris, colors: ColorBoard, frames: FrameBuffer):
+    game.matrix = colors.to_matrix()
+    game.draw_board()
+    frame = frames.update(game.dirty_rects)
+    game.dirty_rects = []
+    return frame
+
+
+def export_game(path, ai: Genetic_AI, seed=None, every=1, fps=20, max_pieces=None):
+    """
+    Plays a headless game of the agent and exports it to path, GIF or any
+    ffmpeg video format, with a frame every `every` pieces. Frames are encoded
+    as they are drawn. Returns the score
+    """
+    game, frames = offscreen_game(ai, seed)
+    colors = ColorBoard()
+    game.board = Bitboard.from_matrix(game.matrix)
+    features = BoardFeatures(game.board)
+    with open_writer(path, SCREEN_SIZE, frames.palette, fps) as writer:
+        writer.write(render(game, colors, frames))
+        while features is not None and game.pieces != max_pieces:
+            features = game.place_headless(features, colors)
+            if game.pieces % every == 0:
+                writer.write(render(game, colors, frames))
+        writer.write(render(game, colors, frames))    # The GIF writer drops it when nothing changed
+    return game.score
+
+
+def export_replay(replay_path, path, game_number=0, every=1, fps=20):
+    """
+    Exports one game of a replay file recorded with replay.ReplayRecorder,
+    like export_game. Placements are read from the memory mapped replay as they
+    are drawn. Returns the score
+    """
+    records = load_replay(replay_path)
+    start, end = np.searchsorted(records['game'], [game_number, game_number + 1])
+    records = records[start:end]
+    game, frames = offscreen_game()
+    colors = ColorBoard()
+    with open_writer(path, SCREEN_SIZE, frames.palette, fps) as writer:
+        for i, (_, record) in enumerate(replay_game(records)):
+            game.next_mino = int(record['piece'])
+            if i % every == 0:
+                writer.write(render(game, colors, frames))
+            colors.record(int(record['piece']), int(record['rotation']), int(record['x']), int(record['y']),
+                          int(record['lines_cleared']))
+            game.score += game.score_multiplier[record['lines_cleared']] * game.level
+            game.lines += int(record['lines_cleared'])
+            game.pieces += 1
+        game.next_mino = None
+        writer.write(render(game, colors, frames))
+    return game.score
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Exports AI games to GIF or video without a display")
+    parser.add_argument('output', help="file to write, .gif or any video format ffmpeg knows")
+    parser.add_argument('--replay', help="replay file to export a game of, by default a new game of the top genes is played")
+    parser.add_argument('--game', type=int, default=0, help="game of the replay to export")
+    parser.add_argument('--seed', type=int, help="piece seed of the played game")
+    parser.add_argument('--max-pieces', type=int, help="stop the played game after this many pieces")
+    parser.add_argument('--every', type=int, default=1, help="pieces per frame")
+    parser.add_argument('--fps', type=int, default=20, help="frames per second")
+    args = parser.parse_args()
+
+    if args.replay:
+        score = export_replay(args.replay, args.output, args.game, args.every, args.fps)
+    else:
+        score = export_game(args.output, Genetic_AI(np.array(TOP_GENE_WEIGHTS)), args.seed, args.every, args.fps,
+                            args.max_pieces)
+    print(f"Exported a game of {score} points to {args.output}")